@@ -0,0 +1,16 @@
+from tfidf.replicas import replica_reads
+
+
+class ReplicaRouter:
+	# Чтение с реплики только внутри read-эндпойнтов (ReplicaReadMixin); запись и миграции — всегда default
+	def db_for_read(self, model, **hints):
+		return "replica" if replica_reads() else "default"
+
+	def db_for_write(self, model, **hints):
+		return "default"
+
+	def allow_relation(self, obj1, obj2, **hints):
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == "default"
@@ -3,6 +3,12 @@
 echo "Running migrations..."
 python manage.py migrate --noinput
 
+echo "Ensuring MongoDB indexes..."
+python manage.py ensure_indexes
+
+echo "Warming up and checking dependencies..."
+python manage.py warmup
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
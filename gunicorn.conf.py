@@ -0,0 +1,34 @@
+import time
+
+# Старт мастера: отсюда считается время до готовности
+_started = time.monotonic()
+
+bind = "0.0.0.0:8000"
+workers = 3
+threads = 2
+timeout = 60
+
+# Приложение импортируется один раз в мастере, воркеры получают его через fork (copy-on-write),
+# поэтому перезапуск воркера не повторяет импорт Django, DRF и pymongo
+preload_app = True
+
+
+def when_ready(server):
+	server.log.info("Master ready in %.3fs (application preloaded)", time.monotonic() - _started)
+
+
+def pre_fork(server, worker):
+	# Соединения, открытые мастером при импорте, не должны достаться воркерам
+	from django.db import connections
+	from tfidf.mongo import close_mongo_clients
+
+	connections.close_all()
+	close_mongo_clients()
+
+
+def post_fork(server, worker):
+	worker.forked_at = time.monotonic()
+
+
+def post_worker_init(worker):
+	worker.log.info("Worker %s ready in %.3fs after fork", worker.pid, time.monotonic() - worker.forked_at)
@@ -0,0 +1,104 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils.cache import get_conditional_response, quote_etag
+from rest_framework.exceptions import Throttled
+
+from .models import Document
+
+# Ограничение числа одновременных тяжёлых вычислений в процессе, чтобы они не занимали все потоки gunicorn
+# и лёгкие эндпойнты не ждали за ними в очереди
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def get_heavy_slots():
+	global _slots
+	if _slots is None:
+		with _slots_lock:
+			if _slots is None:
+				_slots = threading.BoundedSemaphore(settings.ADMISSION_HEAVY_SLOTS)
+	return _slots
+
+
+def content_length(request):
+	try:
+		return int(request.META.get("CONTENT_LENGTH") or 0)
+	except ValueError:
+		return 0
+
+
+def document_cost(request, document_id):
+	return Document.objects.filter(id=document_id, user=request.user).values_list('size', flat=True).first() or 0
+
+
+def collection_cost(request, collection_id):
+	documents = Document.objects.filter(collections__id=collection_id, collections__user=request.user)
+	return documents.aggregate(size=Sum('size'))['size'] or 0
+
+
+def is_heavy(cost):
+	return cost >= settings.ADMISSION_HEAVY_BYTES
+
+
+def acquire_heavy_slot(timeout=None):
+	if timeout is None:
+		timeout = settings.ADMISSION_QUEUE_TIMEOUT
+	return get_heavy_slots().acquire(timeout=timeout)
+
+
+def release_heavy_slot():
+	get_heavy_slots().release()
+
+
+@contextmanager
+def heavy_slot(timeout=None):
+	acquired = acquire_heavy_slot(timeout)
+	try:
+		yield acquired
+	finally:
+		if acquired:
+			release_heavy_slot()
+
+
+class AdmissionControlMixin:
+	# Запрос с оценкой стоимости от ADMISSION_HEAVY_BYTES занимает слот; без свободного слота — 429 с Retry-After.
+	# Для потокового ответа слот держится, пока ответ не будет отдан целиком
+	admission_etag_func = None
+
+	def request_cost(self, request, *args, **kwargs):
+		return content_length(request)
+
+	def is_revalidation(self, request, *args, **kwargs):
+		# Ревалидация, которая закончится 304, ничего не вычисляет и слот не занимает
+		if self.admission_etag_func is None or "If-None-Match" not in request.headers:
+			return False
+		etag = self.admission_etag_func(request, *args, **kwargs)
+		return etag is not None and get_conditional_response(request, etag=quote_etag(etag)) is not None
+
+	def initial(self, request, *args, **kwargs):
+		super().initial(request, *args, **kwargs)
+		if not is_heavy(self.request_cost(request, *args, **kwargs)) or self.is_revalidation(request, *args, **kwargs):
+			return
+		if not acquire_heavy_slot():
+			raise Throttled(wait=settings.ADMISSION_RETRY_AFTER, detail="Server is busy with heavy requests.")
+		self._heavy_slot = True
+
+	def finalize_response(self, request, response, *args, **kwargs):
+		held = getattr(self, "_heavy_slot", False)
+		self._heavy_slot = False
+		try:
+			response = super().finalize_response(request, response, *args, **kwargs)
+		except Exception:
+			if held:
+				release_heavy_slot()
+			raise
+		if held:
+			if response.streaming:
+				# Тело потокового ответа вычисляется при отдаче; close() сервер вызывает после последнего чанка
+				response._resource_closers.append(release_heavy_slot)
+			else:
+				release_heavy_slot()
+		return response
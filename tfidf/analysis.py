@@ -0,0 +1,164 @@
+import re
+from collections import Counter
+from itertools import repeat
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .mongo import document_body_statistics
+from .utils import tokenize, get_tokenize_executor
+
+# Текст разбирается фрагментами, чтобы не строить список токенов всего документа сразу
+ANALYSIS_CHUNK_CHARS = 64 * 1024
+
+# Только \Z: $ совпал бы и перед завершающим \n, и перевод строки на границе чанка терялся бы
+trailing_word_pattern = re.compile(r'\w+\Z')
+
+
+class Statistic:
+	# Плагин анализатора: за один проход получает каждый фрагмент текста вместе с его токенами.
+	# Состояние — Counter, поэтому частичные результаты складываются (в т.ч. через $inc при загрузке по частям)
+	name = None
+
+	def __init__(self):
+		self.counts = Counter()
+
+	def update(self, text, tokens, previous_token):
+		raise NotImplementedError
+
+	def discard(self, text):
+		# Текст, который попал в анализ, но был отброшен (пробелы по краям при strip())
+		pass
+
+	def fields(self):
+		return {}
+
+
+class TermCounts(Statistic):
+	name = "terms"
+
+	def update(self, text, tokens, previous_token):
+		self.counts.update(tokens)
+
+	def fields(self):
+		return document_body_statistics(self.counts)
+
+
+class DocumentLength(Statistic):
+	name = "length"
+
+	def update(self, text, tokens, previous_token):
+		self.counts["characters"] += len(text)
+		self.counts["tokens"] += len(tokens)
+		self.counts["newlines"] += text.count("\n")
+
+	def discard(self, text):
+		self.counts["characters"] -= len(text)
+		self.counts["newlines"] -= text.count("\n")
+
+	def fields(self):
+		characters = self.counts["characters"]
+		return {"length": {
+			"characters": characters,
+			"tokens": self.counts["tokens"],
+			"lines": self.counts["newlines"] + 1 if characters else 0,
+		}}
+
+
+class CharFrequencies(Statistic):
+	# Частоты символов сохраняются в теле документа и используются построителем кодов Хаффмана
+	name = "chars"
+
+	def update(self, text, tokens, previous_token):
+		self.counts.update(text)
+
+	def discard(self, text):
+		self.counts.subtract(text)
+
+	def fields(self):
+		ranked = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+		return {"char_counts": [[char, count] for char, count in ranked if count > 0]}
+
+
+class BigramCounts(Statistic):
+	name = "bigrams"
+	limit = 1000
+
+	def update(self, text, tokens, previous_token):
+		if not tokens:
+			return
+		if previous_token is not None:
+			self.counts[f"{previous_token} {tokens[0]}"] += 1
+		self.counts.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+
+	def fields(self):
+		return {
+			"bigram_counts": [{"bigram": bigram, "count": count} for bigram, count in self.counts.most_common(self.limit)],
+			"bigram_count": len(self.counts),
+		}
+
+
+class Analyzer:
+	def __init__(self, statistics=None, carry="", previous_token=None):
+		paths = settings.TEXT_STATISTICS if statistics is None else statistics
+		self.statistics = [import_string(path)() for path in paths]
+		self.carry = carry
+		self.previous_token = previous_token
+
+	def feed(self, text):
+		# Слово на конце фрагмента может продолжиться в следующем, поэтому откладываем его до следующего вызова
+		text = self.carry + text
+		match = trailing_word_pattern.search(text)
+		self.carry = match.group() if match else ""
+		self._update(text[:match.start()] if match else text)
+
+	def _update(self, text):
+		if not text:
+			return
+		tokens = tokenize(text)
+		for statistic in self.statistics:
+			statistic.update(text, tokens, self.previous_token)
+		if tokens:
+			self.previous_token = tokens[-1]
+
+	def discard(self, text):
+		for statistic in self.statistics:
+			statistic.discard(text)
+
+	def finish(self):
+		self._update(self.carry)
+		self.carry = ""
+		fields = {}
+		for statistic in self.statistics:
+			fields.update(statistic.fields())
+		return fields
+
+	def term_counts(self):
+		for statistic in self.statistics:
+			if isinstance(statistic, TermCounts):
+				return statistic.counts
+		raise LookupError("TermCounts is not configured in TEXT_STATISTICS.")
+
+	def partial_counts(self):
+		return {statistic.name: statistic.counts for statistic in self.statistics}
+
+	def load_counts(self, partial):
+		for statistic in self.statistics:
+			statistic.counts.update(partial.get(statistic.name, {}))
+
+
+def analyze_text(text, statistics=None):
+	analyzer = Analyzer(statistics)
+	for start in range(0, len(text), ANALYSIS_CHUNK_CHARS):
+		analyzer.feed(text[start:start + ANALYSIS_CHUNK_CHARS])
+	fields = analyzer.finish()
+	return analyzer.term_counts(), fields
+
+
+def analyze_texts(texts):
+	# Мелкие батчи считаем в текущем процессе: передача текста в воркер дороже самого анализа.
+	# Список плагинов передаётся явно — в spawn-воркерах настройки Django не загружены
+	statistics = list(settings.TEXT_STATISTICS)
+	if settings.TOKENIZE_WORKERS < 2 or len(texts) < 2 or sum(map(len, texts)) < settings.TOKENIZE_PARALLEL_MIN_CHARS:
+		return [analyze_text(text, statistics) for text in texts]
+	return list(get_tokenize_executor().map(analyze_text, texts, repeat(statistics)))
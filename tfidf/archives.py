@@ -0,0 +1,78 @@
+import tarfile
+import zipfile
+
+from django.conf import settings
+
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class ArchiveError(Exception):
+	pass
+
+
+class ExtractionBudget:
+	# Общий лимит распакованного объёма на весь запрос: все члены всех архивов держатся в памяти до записи в Mongo
+	def __init__(self, limit):
+		self.limit = limit
+		self.used = 0
+
+	def consume(self, size):
+		self.used += size
+		return self.used <= self.limit
+
+
+def is_archive(name):
+	name = name.lower()
+	return name.endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+
+def _skipped(name):
+	parts = name.split("/")
+	return parts[0] == "__MACOSX" or parts[-1].startswith(".")
+
+
+def _read_member(fp, name):
+	# Читаем не больше лимита + 1 байт: размер из заголовка архива может не соответствовать содержимому
+	data = fp.read(settings.ARCHIVE_MAX_MEMBER_SIZE + 1)
+	if len(data) > settings.ARCHIVE_MAX_MEMBER_SIZE:
+		return name, None, "File exceeds the maximum archive member size."
+	return name, data, None
+
+
+def _iter_zip(f):
+	with zipfile.ZipFile(f) as archive:
+		for info in archive.infolist():
+			if info.is_dir() or _skipped(info.filename):
+				continue
+			try:
+				with archive.open(info) as fp:
+					yield _read_member(fp, info.filename)
+			except (RuntimeError, NotImplementedError, zipfile.BadZipFile) as e:
+				# Зашифрованный, повреждённый или с неподдерживаемым сжатием член пропускаем с ошибкой
+				yield info.filename, None, f"File cannot be extracted: {e}"
+
+
+def _iter_tar(f):
+	# Потоковый режим r|*: члены читаются по порядку без произвольного доступа и без распаковки на диск
+	with tarfile.open(fileobj=f, mode="r|*") as archive:
+		for member in archive:
+			if not member.isfile() or _skipped(member.name):
+				continue
+			yield _read_member(archive.extractfile(member), member.name)
+
+
+# Выдаёт (имя, байты, ошибка) для каждого файла архива
+def iter_archive_members(f, budget):
+	name = f.name.lower()
+	members = _iter_zip(f) if name.endswith(ZIP_SUFFIXES) else _iter_tar(f)
+	try:
+		for count, member in enumerate(members, 1):
+			if count > settings.ARCHIVE_MAX_MEMBERS:
+				raise ArchiveError(f"Archive '{f.name}' contains more than {settings.ARCHIVE_MAX_MEMBERS} files.")
+			data = member[1]
+			if not budget.consume(len(data) if data is not None else 0):
+				raise ArchiveError(f"Archive '{f.name}' exceeds the maximum total extracted size for one upload.")
+			yield member
+	except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+		raise ArchiveError(f"Archive '{f.name}' cannot be read: {e}")
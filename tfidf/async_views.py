@@ -0,0 +1,249 @@
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+from pymongo.errors import WriteError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .admission import acquire_heavy_slot, release_heavy_slot, is_heavy, document_cost
+from .etags import document_etag
+from .models import Document
+from .replicas import can_read_from_replica, read_from_replica
+from .mongo import get_async_documents_collection, resolve_huffman_codes, async_document_content, HUFFMAN_MODES, \
+	DOCUMENT_TOO_LARGE_CODES, CONTENT_FIELDS
+from .streaming import get_stream_format, async_streaming_response, iter_async, iter_json_string, JSON_CONTENT_TYPE
+from .utils import huffman_encode, encoded_size, iter_huffman_encode
+
+
+def _authenticate(request):
+	try:
+		result = JWTAuthentication().authenticate(request)
+	except AuthenticationFailed:
+		return None
+	return result[0] if result else None
+
+
+def _check_permissions(request, permission_classes):
+	for permission_class in permission_classes:
+		permission = permission_class()
+		if not permission.has_permission(request, None):
+			return getattr(permission, "message", None) or "You do not have permission to perform this action."
+	return None
+
+
+def _check_throttles(request):
+	# Те же лимиты, что и у APIView (DEFAULT_THROTTLE_CLASSES); возвращает (превышен ли лимит, ожидание в секундах)
+	throttled = False
+	waits = []
+	for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+		throttle = throttle_class()
+		if not throttle.allow_request(request, None):
+			throttled = True
+			wait = throttle.wait()
+			if wait is not None:
+				waits.append(wait)
+	return throttled, max(waits, default=None)
+
+
+def async_read_view(etag_func=None, cost_func=None, permission_classes=(IsAuthenticated,)):
+	# Асинхронный аналог APIView для GET-эндпойнтов: JWT-аутентификация, права, throttling, ETag,
+	# admission control и ошибки в формате DRF
+	def decorator(view):
+		@wraps(view)
+		async def wrapped(request, *args, **kwargs):
+			if request.method not in ("GET", "HEAD"):
+				return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+
+			user = await sync_to_async(_authenticate)(request)
+			if user is None:
+				return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+			request.user = user
+
+			message = _check_permissions(request, permission_classes)
+			if message is not None:
+				return JsonResponse({"detail": str(message)}, status=403)
+
+			throttled, wait = await sync_to_async(_check_throttles)(request)
+			if throttled:
+				detail = "Request was throttled."
+				if wait is not None:
+					detail += f" Expected available in {math.ceil(wait)} seconds."
+				response = JsonResponse({"detail": detail}, status=429)
+				if wait is not None:
+					response["Retry-After"] = str(math.ceil(wait))
+				return response
+
+			if await sync_to_async(can_read_from_replica)(request):
+				with read_from_replica():
+					return await respond(request, *args, **kwargs)
+			return await respond(request, *args, **kwargs)
+
+		async def respond(request, *args, **kwargs):
+			etag = None
+			if etag_func is not None:
+				etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+				if etag is not None:
+					etag = quote_etag(etag)
+					response = get_conditional_response(request, etag=etag)
+					if response is not None:
+						return response
+
+			heavy = cost_func is not None and is_heavy(await sync_to_async(cost_func)(request, *args, **kwargs))
+			# Ожидание слота блокирует поток, поэтому выполняется вне event loop
+			if heavy and not await sync_to_async(acquire_heavy_slot, thread_sensitive=False)():
+				response = JsonResponse({"detail": "Server is busy with heavy requests."}, status=429)
+				response["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+				return response
+
+			try:
+				response = await view(request, *args, **kwargs)
+			except Http404 as e:
+				response = JsonResponse({"detail": str(e) or "Not found."}, status=404)
+				etag = None
+			except BaseException:
+				if heavy:
+					release_heavy_slot()
+				raise
+			if heavy:
+				if response.streaming:
+					# Потоковый ответ кодируется при отдаче: слот освобождается, когда сервер закроет ответ
+					response._resource_closers.append(release_heavy_slot)
+				else:
+					release_heavy_slot()
+
+			if etag is not None and response.status_code == 200:
+				response["ETag"] = etag
+			patch_cache_control(response, private=True, no_cache=True)
+			patch_vary_headers(response, ["Authorization"])
+			return response
+
+		return wrapped
+
+	return decorator
+
+
+async def _get_document(request, document_id):
+	doc = await Document.objects.filter(id=document_id, user=request.user).only("id", "mongo_id").afirst()
+	if not doc:
+		raise Http404("Document not found")
+	return doc
+
+
+def _int_param(request, name, default):
+	try:
+		return int(request.GET.get(name, default))
+	except ValueError:
+		return default
+
+
+@async_read_view(document_etag)
+async def document_content_view(request, document_id):
+	doc = await _get_document(request, document_id)
+	mongo_doc = await get_async_documents_collection().find_one({"_id": ObjectId(doc.mongo_id)}, CONTENT_FIELDS)
+	if not mongo_doc:
+		raise Http404("Document not found in MongoDB")
+
+	content = await async_document_content(mongo_doc)
+	offset = _int_param(request, "offset", 0)
+	limit = _int_param(request, "limit", 10000)
+
+	return JsonResponse({
+		"content": content[offset:offset + limit],
+		"total_size": len(content),
+		"offset": offset,
+		"limit": limit,
+		"is_end": offset + limit >= len(content)
+	}, json_dumps_params={'ensure_ascii': False})
+
+
+def _encode(mongo_doc, content, mode):
+	mode, code_map, symbols, update = resolve_huffman_codes(mongo_doc, mode, content)
+	started = time.perf_counter()
+	encoded_text = huffman_encode(symbols, code_map)
+	return mode, code_map, encoded_text, round((time.perf_counter() - started) * 1000, 3), update
+
+
+def _stream_header(mongo_doc, content, mode):
+	mode, code_map, symbols, update = resolve_huffman_codes(mongo_doc, mode, content)
+	total_size = encoded_size(symbols, code_map)
+	header = {
+		"mode": mode,
+		"huffman_codes": code_map,
+		"total_size": total_size,
+		"compression_ratio": round(total_size / (len(content.encode("utf-8")) * 8), 4),
+	}
+	return header, iter_huffman_encode(symbols, code_map), update
+
+
+async def _cache_huffman_codes(documents_collection, mongo_doc, update):
+	if update is None:
+		return
+	try:
+		await documents_collection.update_one({"_id": mongo_doc["_id"]}, update)
+	except WriteError as e:
+		if e.code not in DOCUMENT_TOO_LARGE_CODES:
+			raise
+
+
+@async_read_view(document_etag, document_cost)
+async def document_huffman_view(request, document_id):
+	doc = await _get_document(request, document_id)
+	documents_collection = get_async_documents_collection()
+	mongo_doc = await documents_collection.find_one(
+		{"_id": ObjectId(doc.mongo_id)}, {**CONTENT_FIELDS, "huffman": 1, "huffman_word": 1, "char_counts": 1}
+	)
+	if not mongo_doc:
+		raise Http404("Document content not found in MongoDB")
+
+	content = await async_document_content(mongo_doc)
+	if not content:
+		return JsonResponse({"error": "Document content is empty"}, status=400)
+
+	mode = request.GET.get("mode", "char")
+	if mode not in HUFFMAN_MODES:
+		return JsonResponse({"error": f"mode must be one of: {', '.join(HUFFMAN_MODES)}"}, status=400)
+
+	stream_format = get_stream_format(request)
+	if stream_format:
+		# Кодирование идёт по частям при отдаче ответа: каждая часть кодируется в пуле потоков, event loop не ждёт
+		# и весь поток бит в памяти не собирается
+		header, chunks, update = await sync_to_async(_stream_header, thread_sensitive=False)(
+			mongo_doc, content, mode
+		)
+		await _cache_huffman_codes(documents_collection, mongo_doc, update)
+		if stream_format == "ndjson":
+			return async_streaming_response(stream_format, header, "encoded_text", chunks)
+		return StreamingHttpResponse(
+			iter_async(iter_json_string(header, "encoded_text", chunks)), content_type=JSON_CONTENT_TYPE
+		)
+
+	# Кодирование нагружает CPU, поэтому выполняется вне event loop
+	mode, code_map, encoded_text, encode_time_ms, update = await sync_to_async(_encode, thread_sensitive=False)(
+		mongo_doc, content, mode
+	)
+	await _cache_huffman_codes(documents_collection, mongo_doc, update)
+
+	offset = _int_param(request, "offset", 0)
+	limit = _int_param(request, "limit", 10000)
+	total_size = len(encoded_text)
+	end = offset + limit
+
+	return JsonResponse({
+		"mode": mode,
+		"huffman_codes": code_map,
+		"encoded_text": encoded_text[offset:end],
+		"total_size": total_size,
+		"compression_ratio": round(total_size / (len(content.encode("utf-8")) * 8), 4),
+		"encode_time_ms": encode_time_ms,
+		"offset": offset,
+		"limit": limit,
+		"is_end": end >= total_size
+	}, json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,280 @@
+import math
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from celery import shared_task
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from .models import Collection
+from .mongo import get_mongo_db, mark_collection_statistics_fresh, iter_term_counts, write_collection_statistics, \
+	new_approximate_document_frequency
+from .sketch import ApproximateDocumentFrequency
+
+PARTIALS_BATCH_SIZE = 5000
+# Незавершённые задания удаляются TTL-индексом через неделю, завершённые — через сутки
+JOB_RETENTION = timedelta(days=7)
+DONE_JOB_RETENTION = timedelta(days=1)
+
+
+def get_jobs_collection():
+	return get_mongo_db()["collection_stats_jobs"]
+
+
+def get_partials_collection():
+	return get_mongo_db()["collection_stats_partials"]
+
+
+def start_distributed_statistics(collection, generation=None):
+	mongo_ids = sorted(set(collection.documents.values_list('mongo_id', flat=True)))
+	size = settings.DISTRIBUTED_STATS_SHARD_SIZE
+	shards = [mongo_ids[i:i + size] for i in range(0, len(mongo_ids), size)]
+	created_at = datetime.utcnow()
+	now = created_at.isoformat()
+
+	job_id = uuid.uuid4().hex
+	get_jobs_collection().insert_one({
+		"_id": job_id,
+		"collection_id": collection.id,
+		"generation": generation,
+		"approximate": settings.APPROXIMATE_DF,
+		"status": "running",
+		"shards": shards,
+		"shards_total": len(shards),
+		"shards_done": [],
+		"shard_documents": {},
+		"created_at": now,
+		"updated_at": now,
+		"expires_at": created_at + JOB_RETENTION,
+	})
+
+	for shard in range(len(shards)):
+		compute_statistics_shard.delay(job_id, shard)
+	return job_id
+
+
+def _lease_expired(lease, now):
+	return not lease or lease["expires_at"] < now
+
+
+def resume_distributed_statistics(job_id):
+	# Перезапускаем только шаги, чья аренда истекла: живой шард или reduce второй раз не запускается
+	job = get_jobs_collection().find_one({"_id": job_id}, {"shards": 0})
+	if not job or job["status"] == "done":
+		return job
+
+	now = datetime.utcnow()
+	if len(job["shards_done"]) == job["shards_total"]:
+		if job["status"] == "running" or _lease_expired(job.get("reduce_lease"), now):
+			reduce_collection_statistics.delay(job_id)
+		return job
+
+	leases = job.get("shard_leases", {})
+	for shard in range(job["shards_total"]):
+		if shard not in job["shards_done"] and _lease_expired(leases.get(str(shard)), now):
+			compute_statistics_shard.delay(job_id, shard)
+	return job
+
+
+def get_job_progress(collection_id):
+	job = get_jobs_collection().find_one(
+		{"collection_id": collection_id}, {"shards": 0, "shard_documents": 0}, sort=[("created_at", -1)]
+	)
+	if not job:
+		return None
+
+	done = len(job["shards_done"])
+	total = job["shards_total"]
+	return {
+		"job_id": job["_id"],
+		"status": job["status"],
+		"shards_total": total,
+		"shards_done": done,
+		"progress": round(done / total, 3) if total else 1.0,
+		"created_at": job["created_at"],
+		"updated_at": job["updated_at"],
+	}
+
+
+def _compute_exact_shard(partials, job_id, shard, attempt, mongo_ids):
+	df = Counter()
+	tf_sum = defaultdict(float)
+	documents = 0
+	for counts in iter_term_counts(mongo_ids):
+		documents += 1
+		total_words = sum(counts.values())
+		if not total_words:
+			continue
+		for word, count in counts.items():
+			df[word] += 1
+			tf_sum[word] += count / total_words
+
+	# Строки помечаются попыткой: reduce учитывает только попытку, которая отметила шард готовым
+	batch = []
+	for word, count in df.items():
+		batch.append({
+			"job_id": job_id, "shard": shard, "attempt": attempt, "word": word, "df": count, "tf_sum": tf_sum[word]
+		})
+		if len(batch) >= PARTIALS_BATCH_SIZE:
+			partials.insert_many(batch, ordered=False)
+			batch = []
+	if batch:
+		partials.insert_many(batch, ordered=False)
+	return documents
+
+
+def _compute_approximate_shard(partials, job_id, shard, attempt, mongo_ids):
+	approximate_df = new_approximate_document_frequency()
+	for counts in iter_term_counts(mongo_ids):
+		approximate_df.add_document(counts)
+
+	partials.insert_one(
+		{"job_id": job_id, "shard": shard, "attempt": attempt, "approximate": approximate_df.to_mongo()}
+	)
+	return approximate_df.documents
+
+
+def _lease(attempt, now):
+	return {"attempt": attempt, "expires_at": now + timedelta(seconds=settings.DISTRIBUTED_STATS_LEASE_SECONDS)}
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True, autoretry_for=(Exception,), max_retries=3,
+			 retry_backoff=True)
+def compute_statistics_shard(job_id, shard):
+	# Шард забирается арендой: пока она жива, переотправка задачи или resume его не пересчитывают
+	jobs = get_jobs_collection()
+	attempt = uuid.uuid4().hex
+	now = datetime.utcnow()
+	lease_field = f"shard_leases.{shard}"
+	job = jobs.find_one_and_update(
+		{
+			"_id": job_id,
+			"status": "running",
+			"shards_done": {"$ne": shard},
+			"$or": [{lease_field: {"$exists": False}}, {f"{lease_field}.expires_at": {"$lt": now}}],
+		},
+		{"$set": {lease_field: _lease(attempt, now)}},
+		projection={"shards": {"$slice": [shard, 1]}, "approximate": 1}
+	)
+	if not job:
+		return
+
+	partials = get_partials_collection()
+	try:
+		if job.get("approximate"):
+			documents = _compute_approximate_shard(partials, job_id, shard, attempt, job["shards"][0])
+		else:
+			documents = _compute_exact_shard(partials, job_id, shard, attempt, job["shards"][0])
+	except Exception:
+		partials.delete_many({"job_id": job_id, "attempt": attempt})
+		jobs.update_one({"_id": job_id, f"{lease_field}.attempt": attempt}, {"$unset": {lease_field: ""}})
+		raise
+
+	# Готовым шард отмечает только одна попытка; её id и становится единственным источником partials шарда
+	job = jobs.find_one_and_update(
+		{"_id": job_id, "shards_done": {"$ne": shard}},
+		{
+			"$addToSet": {"shards_done": shard},
+			"$set": {
+				f"shard_attempts.{shard}": attempt,
+				f"shard_documents.{shard}": documents,
+				"updated_at": datetime.utcnow().isoformat(),
+			},
+		},
+		projection={"shards_done": 1, "shards_total": 1},
+		return_document=ReturnDocument.AFTER
+	)
+	if not job:
+		partials.delete_many({"job_id": job_id, "attempt": attempt})
+		return
+	if len(job["shards_done"]) == job["shards_total"]:
+		reduce_collection_statistics.delay(job_id)
+
+
+def _partials_filter(job):
+	# Задания, запущенные до появления попыток, не помечали partials и читаются целиком
+	if "shard_attempts" not in job:
+		return {"job_id": job["_id"]}
+	return {"job_id": job["_id"], "attempt": {"$in": list(job["shard_attempts"].values())}}
+
+
+def _reduce_exact(job, documents_count):
+	# Слияние DF/TF по шардам выполняется в Mongo, в воркер приходят только итоговые 50 слов
+	top = get_partials_collection().aggregate([
+		{"$match": _partials_filter(job)},
+		{"$group": {"_id": "$word", "df": {"$sum": "$df"}, "tf_sum": {"$sum": "$tf_sum"}}},
+		{"$sort": {"df": 1, "_id": 1}},
+		{"$limit": 50},
+	], allowDiskUse=True)
+
+	return [
+		{
+			"word": row["_id"],
+			"total_tf": round(row["tf_sum"], 6),
+			"idf": round(math.log(documents_count / row["df"]), 6)
+		}
+		for row in top
+	]
+
+
+def _reduce_approximate(job):
+	merged = None
+	for partial in get_partials_collection().find(_partials_filter(job)):
+		approximate_df = ApproximateDocumentFrequency.from_mongo(partial["approximate"])
+		merged = approximate_df if merged is None else merged.merge(approximate_df)
+	return merged.top_words() if merged else []
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True, autoretry_for=(Exception,), max_retries=3,
+			 retry_backoff=True)
+def reduce_collection_statistics(job_id):
+	# Reduce забирается арендой: из running или из reducing, чья аренда истекла вместе с воркером
+	jobs = get_jobs_collection()
+	attempt = uuid.uuid4().hex
+	now = datetime.utcnow()
+	job = jobs.find_one_and_update(
+		{
+			"_id": job_id,
+			"$expr": {"$eq": [{"$size": "$shards_done"}, "$shards_total"]},
+			"$or": [
+				{"status": "running"},
+				{"status": "reducing", "reduce_lease.expires_at": {"$lt": now}},
+				{"status": "reducing", "reduce_lease": {"$exists": False}},
+			],
+		},
+		{"$set": {"status": "reducing", "reduce_lease": _lease(attempt, now), "updated_at": now.isoformat()}},
+		projection={"shards": 0},
+		return_document=ReturnDocument.AFTER
+	)
+	if not job:
+		return
+
+	owned = {"_id": job_id, "status": "reducing", "reduce_lease.attempt": attempt}
+	try:
+		documents_count = sum(job["shard_documents"].values())
+		if job.get("approximate"):
+			top_words = _reduce_approximate(job)
+		else:
+			top_words = _reduce_exact(job, documents_count)
+
+		# Аренду перехватил другой reduce: его результат не хуже, свой не пишем
+		if not jobs.find_one(owned, {"_id": 1}):
+			return
+		collection_id = job["collection_id"]
+		if write_collection_statistics(collection_id, documents_count, top_words, job["generation"]):
+			mark_collection_statistics_fresh(collection_id, job["generation"])
+			Collection.objects.filter(id=collection_id).touch()
+	except Exception:
+		# Возвращаем задание в running, чтобы autoretry смог снова его забрать
+		jobs.update_one(owned, {"$set": {"status": "running"}, "$unset": {"reduce_lease": ""}})
+		raise
+
+	# Задание помечается done до удаления частичных результатов: reduce по пустым partials уже не запустится
+	now = datetime.utcnow()
+	done = jobs.update_one(
+		owned,
+		{"$set": {"status": "done", "updated_at": now.isoformat(), "expires_at": now + DONE_JOB_RETENTION}}
+	)
+	if done.modified_count:
+		get_partials_collection().delete_many({"job_id": job_id})
@@ -0,0 +1,107 @@
+import hashlib
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import Document, Collection
+
+
+def make_etag(*parts):
+	raw = ":".join(str(part) for part in parts)
+	return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional_get(etag_func):
+	# ETag считается до тела view, поэтому 304 отдаётся без запросов в Mongo и пересчёта TF-IDF
+	def decorator(view_method):
+		conditional = method_decorator(condition(etag_func=etag_func))(view_method)
+
+		@wraps(view_method)
+		def wrapped(view, request, *args, **kwargs):
+			response = conditional(view, request, *args, **kwargs)
+			patch_cache_control(response, private=True, no_cache=True)
+			patch_vary_headers(response, ["Authorization"])
+			return response
+
+		return wrapped
+
+	return decorator
+
+
+def _document_version(request, document_id):
+	return Document.objects.filter(id=document_id, user=request.user).values_list('version', flat=True).first()
+
+
+def _collection_version(request, collection_id):
+	return Collection.objects.filter(id=collection_id, user=request.user).values_list('version', flat=True).first()
+
+
+def _library_key(user_id):
+	return f"documents:library_version:{user_id}"
+
+
+def library_version(user_id):
+	# Штамп библиотеки документов пользователя, меняется после каждой его записи. Значение случайное, а не
+	# счётчик: после вытеснения ключа из кэша новый штамп не совпадёт ни с одним выданным ранее ETag
+	key = _library_key(user_id)
+	version = cache.get(key)
+	if version is None:
+		cache.add(key, uuid.uuid4().hex, timeout=None)
+		version = cache.get(key)
+	return version
+
+
+def bump_library_version(user_id):
+	cache.set(_library_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+def document_etag(request, document_id):
+	version = _document_version(request, document_id)
+	if version is None:
+		return None
+	return make_etag("document", document_id, version, request.GET.urlencode())
+
+
+def document_statistics_etag(request, document_id):
+	version = _document_version(request, document_id)
+	if version is None:
+		return None
+
+	collection_id = request.GET.get('collection_id')
+	if collection_id:
+		collection_version = _collection_version(request, collection_id)
+		if collection_version is None:
+			return None
+	else:
+		# IDF по документу считается относительно всей библиотеки пользователя
+		collection_version = library_version(request.user.id)
+
+	return make_etag("statistics", document_id, version, collection_id, collection_version, request.GET.urlencode())
+
+
+def document_list_etag(request):
+	# Без агрегатов по всем документам пользователя: страница keyset-пагинации стоит одинаково на любой глубине
+	return make_etag("documents", request.user.id, library_version(request.user.id), request.GET.urlencode())
+
+
+def collection_etag(request, collection_id):
+	version = _collection_version(request, collection_id)
+	if version is None:
+		return None
+	# В ответ вложены документы со своими коллекциями, поэтому учитываем и их версии
+	stamp = Document.objects.filter(collections__id=collection_id).aggregate(
+		count=Count('id'), versions=Sum('version')
+	)
+	return make_etag("collection", collection_id, version, stamp['count'], stamp['versions'], request.GET.urlencode())
+
+
+def collection_statistics_etag(request, collection_id):
+	version = _collection_version(request, collection_id)
+	if version is None:
+		return None
+	return make_etag("collection-statistics", collection_id, version, request.GET.urlencode())
@@ -0,0 +1,141 @@
+"""
+Бинарный формат выгрузки матрицы документ-термин коллекции (TFDTM, версия 1).
+
+Все числа little-endian.
+
+    header   magic b"TFDTM001", uint32 documents_count
+    rows     documents_count раз:
+                 int64 document_id, uint32 word_count, uint32 nnz,
+                 uint32[nnz] term indices, uint32[nnz] counts
+    footer   uint32 terms_count,
+             terms_count раз: uint32 byte length + utf-8 bytes термина,
+             uint32[terms_count] df, float64[terms_count] idf
+
+Индексы терминов выдаются в порядке первого появления, поэтому словарь
+пишется в конце и выгрузку можно отдавать потоком без второго прохода.
+Строки документов, не найденных в MongoDB, пишутся с nnz = 0 и в расчёт
+IDF не входят.
+"""
+import math
+import struct
+from array import array
+from collections import Counter
+
+from bson import ObjectId
+
+from .mongo import get_documents_collection, document_content, term_counts_from_mongo, CONTENT_FIELDS
+from .utils import tokenize
+
+MAGIC = b"TFDTM001"
+CONTENT_TYPE = "application/octet-stream"
+FETCH_BATCH_SIZE = 200
+
+
+def _le(values):
+	if struct.pack("=I", 1) != struct.pack("<I", 1):
+		values.byteswap()
+	return values.tobytes()
+
+
+def _iter_documents(rows):
+	for i in range(0, len(rows), FETCH_BATCH_SIZE):
+		yield from _fetch_batch(rows[i:i + FETCH_BATCH_SIZE])
+
+
+def _fetch_batch(batch):
+	# Берём сохранённые term_counts, как и статистика коллекции; текст читаем только для старых тел без них
+	documents_collection = get_documents_collection()
+	cursor = documents_collection.find(
+		{"_id": {"$in": [ObjectId(mongo_id) for _, mongo_id in batch]}}, {"term_counts": 1}
+	)
+	counts = {}
+	legacy = []
+	for item in cursor:
+		if "term_counts" in item:
+			counts[str(item["_id"])] = term_counts_from_mongo(item)
+		else:
+			legacy.append(item["_id"])
+	if legacy:
+		for item in documents_collection.find({"_id": {"$in": legacy}}, CONTENT_FIELDS):
+			counts[str(item["_id"])] = Counter(tokenize(document_content(item)))
+
+	for document_id, mongo_id in batch:
+		yield document_id, counts.get(mongo_id)
+
+
+def iter_document_term_matrix(collection):
+	vocabulary = {}
+	df = array("I")
+	found = 0
+
+	# Число строк в заголовке и сами строки берутся из одного снимка состава коллекции
+	rows = list(collection.documents.order_by('id').values_list('id', 'mongo_id'))
+	yield MAGIC + struct.pack("<I", len(rows))
+
+	for document_id, counts in _iter_documents(rows):
+		if counts is None:
+			yield struct.pack("<qII", document_id, 0, 0)
+			continue
+
+		found += 1
+		indices = array("I")
+		values = array("I")
+		for word, count in counts.items():
+			index = vocabulary.get(word)
+			if index is None:
+				index = vocabulary[word] = len(vocabulary)
+				df.append(0)
+			df[index] += 1
+			indices.append(index)
+			values.append(count)
+
+		yield struct.pack("<qII", document_id, sum(values), len(indices)) + _le(indices) + _le(values)
+
+	parts = [struct.pack("<I", len(vocabulary))]
+	for word in vocabulary:
+		encoded = word.encode("utf-8")
+		parts.append(struct.pack("<I", len(encoded)) + encoded)
+	yield b"".join(parts)
+
+	idf = array("d", (math.log(found / count) for count in df))
+	yield _le(df) + _le(idf)
+
+
+def read_document_term_matrix(fp):
+	def read(fmt):
+		size = struct.calcsize(fmt)
+		return struct.unpack(fmt, fp.read(size))
+
+	def read_array(typecode, length):
+		values = array(typecode)
+		values.frombytes(fp.read(values.itemsize * length))
+		if struct.pack("=I", 1) != struct.pack("<I", 1):
+			values.byteswap()
+		return values
+
+	if fp.read(len(MAGIC)) != MAGIC:
+		raise ValueError("Not a TFDTM v1 stream.")
+
+	(documents_count,) = read("<I")
+	rows = []
+	for _ in range(documents_count):
+		document_id, word_count, nnz = read("<qII")
+		rows.append({
+			"document_id": document_id,
+			"word_count": word_count,
+			"indices": read_array("I", nnz),
+			"counts": read_array("I", nnz),
+		})
+
+	(terms_count,) = read("<I")
+	terms = []
+	for _ in range(terms_count):
+		(length,) = read("<I")
+		terms.append(fp.read(length).decode("utf-8"))
+
+	return {
+		"rows": rows,
+		"terms": terms,
+		"df": read_array("I", terms_count),
+		"idf": read_array("d", terms_count),
+	}
@@ -0,0 +1,177 @@
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from pymongo import UpdateOne
+
+from .mongo import get_mongo_db
+
+logger = logging.getLogger(__name__)
+
+# Логарифмические корзины: граница каждой следующей на 10% больше, т.е. относительная ошибка перцентиля <= 10%
+MIN_LATENCY_MS = 0.1
+BUCKET_GROWTH = 1.1
+
+GRANULARITIES = {
+	"minute": (60, timedelta(days=2)),
+	"hour": (3600, timedelta(days=30)),
+}
+
+WINDOWS = {
+	"15m": ("minute", 15 * 60),
+	"1h": ("minute", 60 * 60),
+	"24h": ("hour", 24 * 60 * 60),
+	"7d": ("hour", 7 * 24 * 60 * 60),
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def get_latency_collection():
+	return get_mongo_db()["latency_histograms"]
+
+
+def bucket_index(latency_ms):
+	if latency_ms <= MIN_LATENCY_MS:
+		return 0
+	return math.ceil(math.log(latency_ms / MIN_LATENCY_MS, BUCKET_GROWTH))
+
+
+def bucket_upper_bound(index):
+	return MIN_LATENCY_MS * BUCKET_GROWTH ** index
+
+
+# Замеры копятся в памяти процесса и пишутся в Mongo фоновым потоком раз в LATENCY_FLUSH_INTERVAL секунд,
+# поэтому на пути ответа нет синхронной записи
+_buffer = {}
+_buffer_lock = threading.Lock()
+_flusher = None
+
+
+def record_latency(endpoint, latency_ms):
+	now = time.time()
+	index = bucket_index(latency_ms)
+	with _buffer_lock:
+		for granularity, (size, retention) in GRANULARITIES.items():
+			start = int(now // size * size)
+			histogram = _buffer.get((endpoint, granularity, start))
+			if histogram is None:
+				histogram = _buffer[(endpoint, granularity, start)] = {
+					"buckets": Counter(), "count": 0, "sum_ms": 0.0, "max_ms": 0.0,
+					"expires_at": datetime.fromtimestamp(start, timezone.utc) + retention,
+				}
+			histogram["buckets"][index] += 1
+			histogram["count"] += 1
+			histogram["sum_ms"] += latency_ms
+			histogram["max_ms"] = max(histogram["max_ms"], latency_ms)
+	_ensure_flusher()
+
+
+def flush_latencies():
+	global _buffer
+	with _buffer_lock:
+		buffered, _buffer = _buffer, {}
+	if not buffered:
+		return
+
+	operations = [
+		UpdateOne(
+			{"endpoint": endpoint, "granularity": granularity, "start": start},
+			{
+				"$inc": {
+					**{f"buckets.{index}": count for index, count in histogram["buckets"].items()},
+					"count": histogram["count"],
+					"sum_ms": histogram["sum_ms"],
+				},
+				"$max": {"max_ms": histogram["max_ms"]},
+				"$setOnInsert": {"expires_at": histogram["expires_at"]},
+			},
+			upsert=True
+		)
+		for (endpoint, granularity, start), histogram in buffered.items()
+	]
+	try:
+		get_latency_collection().bulk_write(operations, ordered=False)
+	except Exception:
+		logger.exception("Failed to flush %d latency histograms", len(operations))
+
+
+def _flush_periodically():
+	while True:
+		time.sleep(settings.LATENCY_FLUSH_INTERVAL)
+		flush_latencies()
+
+
+def _ensure_flusher():
+	global _flusher
+	if _flusher is None:
+		with _buffer_lock:
+			if _flusher is None:
+				_flusher = threading.Thread(target=_flush_periodically, name="latency-flusher", daemon=True)
+				_flusher.start()
+
+
+def _reset_after_fork():
+	# Поток и буфер родителя в дочернем процессе не используются
+	global _buffer, _buffer_lock, _flusher
+	_buffer = {}
+	_buffer_lock = threading.Lock()
+	_flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush_latencies)
+
+
+def percentile(buckets, count, value, max_ms=None):
+	# Верхняя граница корзины может превышать реальный максимум, поэтому ограничиваем её max_ms
+	rank = math.ceil(count * value / 100)
+	seen = 0
+	for index in sorted(buckets):
+		seen += buckets[index]
+		if seen >= rank:
+			upper_bound = bucket_upper_bound(index)
+			return round(upper_bound if max_ms is None else min(upper_bound, max_ms), 3)
+	return None
+
+
+def summarize(histogram):
+	count = histogram["count"]
+	summary = {
+		"count": count,
+		"avg_ms": round(histogram["sum_ms"] / count, 3) if count else 0.0,
+		"max_ms": round(histogram["max_ms"], 3),
+	}
+	for value in PERCENTILES:
+		summary[f"p{value}_ms"] = percentile(histogram["buckets"], count, value, histogram["max_ms"])
+	return summary
+
+
+def get_latency_percentiles(windows=WINDOWS):
+	now = time.time()
+	collection = get_latency_collection()
+	result = {}
+
+	for window, (granularity, seconds) in windows.items():
+		merged = {}
+		cursor = collection.find({"granularity": granularity, "start": {"$gt": now - seconds - GRANULARITIES[granularity][0]}})
+		for doc in cursor:
+			histogram = merged.setdefault(doc["endpoint"], {
+				"count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": Counter()
+			})
+			histogram["count"] += doc.get("count", 0)
+			histogram["sum_ms"] += doc.get("sum_ms", 0.0)
+			histogram["max_ms"] = max(histogram["max_ms"], doc.get("max_ms", 0.0))
+			for index, count in doc.get("buckets", {}).items():
+				histogram["buckets"][int(index)] += count
+
+		for endpoint, histogram in merged.items():
+			result.setdefault(endpoint, {})[window] = summarize(histogram)
+
+	return result
@@ -0,0 +1,69 @@
+import random
+import string
+import time
+from collections import Counter
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from tfidf.models import Document
+from tfidf.mongo import get_documents_collection, document_content, CONTENT_FIELDS
+from tfidf.utils import build_huffman_codes, huffman_encode, pack_bits, HuffmanDecoder
+
+
+def synthetic_text(size, seed=0):
+	# Слова с распределением Ципфа, чтобы частоты символов были похожи на естественный текст
+	rng = random.Random(seed)
+	vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+	weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+	words = []
+	length = 0
+	while length < size:
+		batch = rng.choices(vocabulary, weights=weights, k=10000)
+		words.extend(batch)
+		length += sum(map(len, batch)) + len(batch)
+	return " ".join(words)[:size]
+
+
+class Command(BaseCommand):
+	help = "Measure Huffman encode/decode throughput and verify the round trip"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--size-mb", type=float, default=4.0, help="Size of the synthetic text")
+		parser.add_argument("--document", type=int, help="Use the content of this document instead")
+		parser.add_argument("--lookup-bits", type=int, default=12)
+
+	def _timed(self, label, func, size):
+		started = time.perf_counter()
+		result = func()
+		elapsed = time.perf_counter() - started
+		self.stdout.write(f"{label:<14} {elapsed * 1000:10.1f} ms  {size / elapsed / 1_000_000:8.2f} M chars/s")
+		return result
+
+	def handle(self, *args, **options):
+		if options["document"] is not None:
+			doc = Document.objects.filter(id=options["document"]).first()
+			body = doc and get_documents_collection().find_one({"_id": ObjectId(doc.mongo_id)}, CONTENT_FIELDS)
+			if not body:
+				raise CommandError(f"Document {options['document']} does not exist.")
+			text = document_content(body)
+		else:
+			text = synthetic_text(int(options["size_mb"] * 1024 * 1024))
+		if not text:
+			raise CommandError("Text is empty.")
+
+		size = len(text)
+		self.stdout.write(self.style.MIGRATE_HEADING(f"{size} characters"))
+		codes = self._timed("build codes", lambda: build_huffman_codes(Counter(text)), size)
+		bits = self._timed("encode", lambda: huffman_encode(text, codes), size)
+		data, bit_length = self._timed("pack", lambda: pack_bits(bits), size)
+		decoder = HuffmanDecoder(codes, lookup_bits=options["lookup_bits"])
+		decoded = self._timed("decode", lambda: decoder.decode(data, bit_length), size)
+
+		self.stdout.write(
+			f"{len(codes)} symbols, max code length {decoder.max_length}, "
+			f"{bit_length / size:.3f} bits/char, {len(data)} bytes packed"
+		)
+		if decoded != text:
+			raise CommandError("Round trip failed: decoded text differs from the input.")
+		self.stdout.write(self.style.SUCCESS("Round trip OK"))
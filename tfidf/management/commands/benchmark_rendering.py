@@ -0,0 +1,111 @@
+import random
+import statistics
+import string
+import time
+from datetime import datetime, timezone
+
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from tfidf.models import Collection
+from tfidf.payloads import collection_detail_payload
+from tfidf.renderers import ORJSONRenderer
+from tfidf.serializers import CollectionSerializer, CollectionStatisticsSerializer
+
+
+def _word(rng):
+	return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))
+
+
+def _top_words(rng, count):
+	return [
+		{"word": _word(rng), "total_tf": round(rng.random(), 6), "idf": round(rng.random() * 10, 6)}
+		for _ in range(count)
+	]
+
+
+def _collection_detail(rng, documents):
+	created_at = datetime.now(timezone.utc)
+	return {
+		"id": 1,
+		"name": "benchmark",
+		"documents": [
+			{
+				"id": i,
+				"name": f"{_word(rng)}.txt",
+				"size": rng.randint(100, 10 ** 7),
+				"word_count": rng.randint(10, 10 ** 6),
+				"created_at": created_at.isoformat().replace("+00:00", "Z"),
+				"mongo_id": "%024x" % rng.getrandbits(96),
+				"collections": [{"id": 1, "name": "benchmark"}],
+			}
+			for i in range(documents)
+		],
+	}
+
+
+class Command(BaseCommand):
+	help = "Compare serializer + stdlib JSON rendering with the pre-serialized orjson fast path on our payload shapes"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--documents", type=int, default=2000, help="Documents in the synthetic collection detail")
+		parser.add_argument("--words", type=int, default=50, help="Words in the synthetic statistics ranking")
+		parser.add_argument("--repeat", type=int, default=20)
+		parser.add_argument("--collection", type=int, help="Also benchmark CollectionDetailView paths on this collection")
+
+	def _measure(self, label, func, repeat):
+		size = len(func())
+		samples = []
+		for _ in range(repeat):
+			started = time.perf_counter()
+			func()
+			samples.append((time.perf_counter() - started) * 1000)
+		self.stdout.write(
+			f"{label:<42} median {statistics.median(samples):9.3f} ms  min {min(samples):9.3f} ms  {size} bytes"
+		)
+
+	def handle(self, *args, **options):
+		rng = random.Random(0)
+		repeat = options["repeat"]
+		json_renderer = JSONRenderer()
+		orjson_renderer = ORJSONRenderer()
+
+		stats = {
+			"collection_id": 1,
+			"documents_count": options["documents"],
+			"top_words": _top_words(rng, options["words"]),
+			"stale": False,
+			"computed_at": datetime.utcnow().isoformat(),
+		}
+		top_words_json = orjson.dumps(stats["top_words"])
+
+		self.stdout.write(self.style.MIGRATE_HEADING(f"Collection statistics ({options['words']} words)"))
+		self._measure(
+			"serializer + JSONRenderer",
+			lambda: json_renderer.render(CollectionStatisticsSerializer(stats).data), repeat
+		)
+		self._measure(
+			"stored JSON fragment + ORJSONRenderer",
+			lambda: orjson_renderer.render({**stats, "top_words": orjson.Fragment(top_words_json)}), repeat
+		)
+
+		detail = _collection_detail(rng, options["documents"])
+		self.stdout.write(self.style.MIGRATE_HEADING(f"Collection detail ({options['documents']} documents, synthetic)"))
+		self._measure("JSONRenderer", lambda: json_renderer.render(detail), repeat)
+		self._measure("ORJSONRenderer", lambda: orjson_renderer.render(detail), repeat)
+
+		if options["collection"] is not None:
+			collection = Collection.objects.filter(id=options["collection"]).first()
+			if not collection:
+				raise CommandError(f"Collection {options['collection']} does not exist.")
+
+			self.stdout.write(self.style.MIGRATE_HEADING(f"Collection detail (collection {collection.id}, database)"))
+			self._measure(
+				"CollectionSerializer + JSONRenderer",
+				lambda: json_renderer.render(CollectionSerializer(collection).data), repeat
+			)
+			self._measure(
+				"values() payload + ORJSONRenderer",
+				lambda: orjson_renderer.render(collection_detail_payload(collection)), repeat
+			)
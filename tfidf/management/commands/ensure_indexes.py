@@ -0,0 +1,94 @@
+import time
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from tfidf.models import Document, Collection
+from tfidf.mongo import ensure_mongo_indexes, get_mongo_db
+
+# Горячие запросы из views/mongo/tasks; в check-режиме ни один из них не должен выполняться полным сканированием
+MONGO_HOT_QUERIES = [
+	("documents", {"_id": {"$in": [ObjectId()]}}, None),
+	("documents", {"content_hash": {"$in": ["0" * 64]}}, None),
+	("collection_statistics", {"collection_id": 0}, None),
+	("latency_histograms", {"granularity": "minute", "start": {"$gt": 0}}, None),
+	("collection_stats_jobs", {"collection_id": 0}, [("created_at", -1)]),
+	("collection_stats_partials", {"job_id": "", "attempt": {"$in": [""]}}, None),
+	("upload_chunks", {"upload_id": ""}, [("offset", 1)]),
+	("library_frequencies", {"user_id": 0, "word": {"$in": [""]}}, None),
+	("library_bodies", {"user_id": 0, "mongo_id": ""}, None),
+]
+
+
+def postgres_hot_queries():
+	return [
+		("documents by user", Document.objects.filter(user_id=0).order_by('-id')[:20]),
+		("collections by user", Collection.objects.filter(user_id=0).order_by('-id')[:20]),
+		("documents by collection", Document.objects.filter(collections__id=0)),
+		("document by id and user", Document.objects.filter(id=0, user_id=0)),
+	]
+
+
+def _stages(plan):
+	yield plan.get("stage")
+	for key in ("inputStage", "queryPlan"):
+		if key in plan:
+			yield from _stages(plan[key])
+	for child in plan.get("inputStages", []):
+		yield from _stages(child)
+
+
+class Command(BaseCommand):
+	help = "Create the MongoDB indexes the application relies on (idempotent); --check verifies hot query plans"
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--check", action="store_true",
+			help="Run explain() on hot queries and fail if any of them is a collection or sequential scan"
+		)
+
+	def handle(self, *args, **options):
+		start = time.perf_counter()
+		for name in ensure_mongo_indexes():
+			self.stdout.write(f"ok {name}")
+		self.stdout.write(f"Indexes ensured in {time.perf_counter() - start:.2f}s")
+
+		if options["check"]:
+			failures = self.check_mongo() + self.check_postgres()
+			if failures:
+				raise CommandError("Full scans detected: " + "; ".join(failures))
+			self.stdout.write(self.style.SUCCESS("All hot queries use indexes"))
+
+	def check_mongo(self):
+		db = get_mongo_db()
+		failures = []
+		for collection_name, query, sort in MONGO_HOT_QUERIES:
+			cursor = db[collection_name].find(query)
+			if sort:
+				cursor = cursor.sort(sort)
+			plan = cursor.explain()["queryPlanner"]["winningPlan"]
+			stages = [stage for stage in _stages(plan) if stage]
+			label = f"mongo {collection_name} {query}"
+			if "COLLSCAN" in stages:
+				failures.append(label)
+				self.stdout.write(self.style.ERROR(f"COLLSCAN {label}"))
+			else:
+				self.stdout.write(f"{' > '.join(stages)} {label}")
+		return failures
+
+	def check_postgres(self):
+		failures = []
+		# На маленьких таблицах планировщик и так выбирает Seq Scan, поэтому запрещаем его на время проверки
+		with transaction.atomic():
+			if connection.vendor == "postgresql":
+				with connection.cursor() as cursor:
+					cursor.execute("SET LOCAL enable_seqscan = off")
+			for label, queryset in postgres_hot_queries():
+				plan = queryset.explain()
+				if "Seq Scan" in plan:
+					failures.append(f"postgres {label}")
+					self.stdout.write(self.style.ERROR(f"Seq Scan postgres {label}\n{plan}"))
+				else:
+					self.stdout.write(f"ok postgres {label}")
+		return failures
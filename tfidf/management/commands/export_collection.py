@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tfidf.export import iter_document_term_matrix
+from tfidf.models import Collection
+
+
+class Command(BaseCommand):
+	help = "Export a collection's document-term matrix, vocabulary and IDF vector in TFDTM binary format"
+
+	def add_arguments(self, parser):
+		parser.add_argument("collection_id", type=int)
+		parser.add_argument("output", help="Path of the .tfdtm file to write")
+
+	def handle(self, *args, **options):
+		collection = Collection.objects.filter(id=options["collection_id"]).first()
+		if not collection:
+			raise CommandError(f"Collection {options['collection_id']} does not exist.")
+
+		written = 0
+		with open(options["output"], "wb") as fp:
+			for chunk in iter_document_term_matrix(collection):
+				fp.write(chunk)
+				written += len(chunk)
+
+		self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
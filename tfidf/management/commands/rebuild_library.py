@@ -0,0 +1,22 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from tfidf.models import Document
+from tfidf.mongo import rebuild_library
+
+
+class Command(BaseCommand):
+	help = "Rebuild per-user document frequencies used for document IDF (run once after deploy to fill them in)"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--user", type=int, action="append", help="Rebuild only these user ids")
+
+	def handle(self, *args, **options):
+		user_ids = options["user"] or get_user_model().objects.order_by('id').values_list('id', flat=True)
+		for user_id in user_ids:
+			start = time.perf_counter()
+			mongo_ids = Document.objects.filter(user_id=user_id).values_list('mongo_id', flat=True)
+			documents = rebuild_library(user_id, list(mongo_ids))
+			self.stdout.write(f"user {user_id}: {documents} documents in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,83 @@
+import importlib
+import os
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from tfidf.mongo import get_mongo_client
+
+WARMUP_MODULES = [
+	"config.urls",
+	"tfidf.views",
+	"tfidf.async_views",
+	"tfidf.serializers",
+	"tfidf.tasks",
+	"tfidf.distributed",
+	"tfidf.export",
+]
+
+
+def process_uptime():
+	# Время с запуска процесса по /proc (Linux); включает старт интерпретатора и django.setup()
+	try:
+		with open("/proc/self/stat") as fp:
+			started_ticks = int(fp.read().rsplit(")", 1)[1].split()[19])
+		with open("/proc/uptime") as fp:
+			uptime = float(fp.read().split()[0])
+	except (OSError, ValueError, IndexError):
+		return None
+	return uptime - started_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def ping_postgres():
+	with connection.cursor() as cursor:
+		cursor.execute("SELECT 1")
+
+
+def ping_mongo():
+	get_mongo_client().admin.command("ping")
+
+
+def ping_redis():
+	cache.set("warmup:ping", 1, timeout=10)
+	if cache.get("warmup:ping") != 1:
+		raise RuntimeError("cache round trip failed")
+
+
+class Command(BaseCommand):
+	help = "Pre-import application modules, ping PostgreSQL/MongoDB/Redis and report startup timings"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--no-ping", action="store_true", help="Only measure imports")
+
+	def _step(self, label, func):
+		started = time.perf_counter()
+		try:
+			func()
+		except Exception as e:
+			self.stdout.write(self.style.ERROR(f"{label:<28} FAILED  {e}"))
+			return False
+		self.stdout.write(f"{label:<28} {(time.perf_counter() - started) * 1000:9.1f} ms")
+		return True
+
+	def handle(self, *args, **options):
+		boot = process_uptime()
+		if boot is not None:
+			self.stdout.write(f"{'process start -> command':<28} {boot * 1000:9.1f} ms")
+
+		started = time.perf_counter()
+		ok = all([self._step(f"import {module}", lambda m=module: importlib.import_module(m)) for module in WARMUP_MODULES])
+
+		if not options["no_ping"]:
+			ok = all([
+				self._step("ping postgres", ping_postgres),
+				self._step("ping mongo", ping_mongo),
+				self._step("ping redis", ping_redis),
+			]) and ok
+
+		self.stdout.write(f"{'warmup total':<28} {(time.perf_counter() - started) * 1000:9.1f} ms")
+		if not ok:
+			raise CommandError("Warm-up failed for some dependencies.")
+		self.stdout.write(self.style.SUCCESS("Warm-up complete"))
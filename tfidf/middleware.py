@@ -0,0 +1,170 @@
+import json
+import logging
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .etags import bump_library_version
+from .histograms import record_latency
+from .mongo import get_memory_profiles_collection
+from .replicas import mark_recent_write
+from .profiling import profiling_requested, start_memory_profile, stop_memory_profile, memory_profile_report
+from .timing import start_request_timings, stop_request_timings
+
+logger = logging.getLogger("tfidf.slow_requests")
+memory_logger = logging.getLogger("tfidf.memory_profiles")
+
+MEMORY_PROFILE_RETENTION = timedelta(days=7)
+
+
+def _sql_timing(timings):
+	stack = ExitStack()
+	for connection in connections.all():
+		stack.enter_context(connection.execute_wrapper(timings.sql_wrapper))
+	return stack
+
+
+class ServerTimingMiddleware:
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+
+		timings, token = start_request_timings()
+		try:
+			with _sql_timing(timings):
+				response = self.get_response(request)
+		finally:
+			stop_request_timings(token)
+
+		self.finish(request, response, timings)
+		return response
+
+	async def __acall__(self, request):
+		timings, token = start_request_timings()
+		try:
+			with _sql_timing(timings):
+				response = await self.get_response(request)
+		finally:
+			stop_request_timings(token)
+
+		await sync_to_async(self.finish, thread_sensitive=False)(request, response, timings)
+		return response
+
+	def finish(self, request, response, timings):
+		total_ms = timings.total_ms()
+		response["Server-Timing"] = timings.header()
+
+		match = request.resolver_match
+		if settings.LATENCY_HISTOGRAMS_ENABLED and match is not None:
+			record_latency(f"{request.method} /{match.route}", total_ms)
+
+		if total_ms >= settings.SLOW_REQUEST_THRESHOLD_MS:
+			phases = timings.as_dict()
+			logger.warning(json.dumps({
+				"event": "slow_request",
+				"method": request.method,
+				"path": request.path,
+				"status": response.status_code,
+				"total_ms": round(total_ms, 1),
+				"db_queries": phases.get("db", {}).get("count", 0),
+				"mongo_commands": phases.get("mongo", {}).get("count", 0),
+				"phases": phases,
+			}))
+
+
+class MemoryProfilingMiddleware:
+	# Включается настройкой MEMORY_PROFILING_ENABLED или заголовком X-Memory-Profile с MEMORY_PROFILING_TOKEN;
+	# пик памяти и места аллокаций считаются по фазам phase()
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+
+		state = start_memory_profile() if profiling_requested(request) else None
+		if state is None:
+			return self.get_response(request)
+
+		try:
+			response = self.get_response(request)
+		finally:
+			profile, peak = stop_memory_profile(state)
+
+		self.write(memory_profile_report(request, response, profile, peak))
+		return response
+
+	async def __acall__(self, request):
+		state = start_memory_profile() if profiling_requested(request) else None
+		if state is None:
+			return await self.get_response(request)
+
+		try:
+			response = await self.get_response(request)
+		finally:
+			profile, peak = stop_memory_profile(state)
+
+		await sync_to_async(self.write, thread_sensitive=False)(memory_profile_report(request, response, profile, peak))
+		return response
+
+	def write(self, report):
+		if settings.MEMORY_PROFILING_OUTPUT == "mongo":
+			now = datetime.utcnow()
+			try:
+				get_memory_profiles_collection().insert_one(
+					{**report, "created_at": now, "expires_at": now + MEMORY_PROFILE_RETENTION}
+				)
+				return
+			except Exception:
+				memory_logger.exception("Failed to store memory profile, falling back to log")
+
+		memory_logger.info(json.dumps({"event": "memory_profile", **report}))
+
+
+class ReadYourWritesMiddleware:
+	# После успешного изменяющего запроса пользователь на REPLICA_READ_YOUR_WRITES_SECONDS читает с primary,
+	# а штамп его библиотеки (ETag списка документов) меняется; request.user уже выставлен JWT-аутентификацией DRF
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+
+		response = self.get_response(request)
+		self.finish(request, response)
+		return response
+
+	async def __acall__(self, request):
+		response = await self.get_response(request)
+		await sync_to_async(self.finish)(request, response)
+		return response
+
+	def finish(self, request, response):
+		if request.method in ("GET", "HEAD", "OPTIONS") or response.status_code >= 400:
+			return
+		user = getattr(request, "user", None)
+		if user is not None and user.is_authenticated:
+			mark_recent_write(user)
+			bump_library_version(user.id)
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tfidf', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
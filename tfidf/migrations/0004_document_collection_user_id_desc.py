@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tfidf', '0003_collection_version_document_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', '-id'], name='document_user_id_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['user', '-id'], name='collection_user_id_desc'),
+        ),
+    ]
@@ -2,6 +2,10 @@ from django.db import models
 from django.conf import settings
 
 
+class VersionedQuerySet(models.QuerySet):
+	def touch(self):
+		return self.update(version=models.F('version') + 1)
+
 
 class Document(models.Model):
 	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -10,8 +14,16 @@ class Document(models.Model):
 	size = models.IntegerField()
 	word_count = models.IntegerField()
 	mongo_id = models.CharField(max_length=100)
+	version = models.PositiveIntegerField(default=1)
 	created_at = models.DateTimeField(auto_now_add=True)
 
+	objects = VersionedQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['user', '-id'], name='document_user_id_desc'),
+		]
+
 	def __str__(self):
 		return self.name
 
@@ -20,4 +32,12 @@ class Collection(models.Model):
 	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="collections")
 	name = models.CharField(max_length=255)
 	documents = models.ManyToManyField(Document, related_name="collections")
+	version = models.PositiveIntegerField(default=1)
 	created_at = models.DateTimeField(auto_now_add=True)
+
+	objects = VersionedQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['user', '-id'], name='collection_user_id_desc'),
+		]
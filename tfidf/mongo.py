@@ -1,32 +1,479 @@
+import hashlib
+import math
+import os
+from collections import Counter
 from datetime import datetime
 
-from bson import ObjectId
-from pymongo import MongoClient
+import bson
+import orjson
+from bson import Binary, ObjectId
+from gridfs import AsyncGridFSBucket, GridFSBucket
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, MongoClient, ReadPreference, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import WriteError
 from django.conf import settings
 
-from .utils import compute_global_tfidf_table
+from .replicas import replica_reads
+from .timing import current_timings, phase
+from .sketch import ApproximateDocumentFrequency
+from .utils import build_huffman_codes, tokenize, word_rank_key, huffman_symbols, \
+	huffman_table_bits, encoded_size
 
+# Коды ошибок сервера, когда документ после обновления превысил бы лимит BSON
+DOCUMENT_TOO_LARGE_CODES = (10334, 17419)
 
-def get_mongo_db():
+# Лимит BSON для тела документа с запасом на ref_count и кэшируемые таблицы Хаффмана
+BODY_SIZE_LIMIT = 16 * 1024 * 1024 - 256 * 1024
+
+# Текст больше этого размера хранится в GridFS, в теле остаются только статистика и ссылка content_file_id
+CONTENT_INLINE_MAX_SIZE = 4 * 1024 * 1024
+CONTENT_FIELDS = {"content": 1, "content_file_id": 1}
+
+LIBRARY_BATCH_SIZE = 5000
+
+# v2: канонические коды (восстанавливаются по длинам, нужны табличному декодеру)
+HUFFMAN_ARTIFACT_VERSION = 2
+
+
+class MongoTimingListener(monitoring.CommandListener):
+	def started(self, event):
+		pass
+
+	def succeeded(self, event):
+		self._record(event)
+
+	def failed(self, event):
+		self._record(event)
+
+	def _record(self, event):
+		timings = current_timings()
+		if timings is not None:
+			timings.add("mongo", event.duration_micros / 1_000_000)
+
+
+MONGO_INDEXES = {
+	"documents": [
+		{
+			"keys": [("content_hash", ASCENDING)],
+			"unique": True,
+			"partialFilterExpression": {"content_hash": {"$exists": True}},
+		},
+	],
+	"collection_statistics": [
+		{"keys": [("collection_id", ASCENDING)], "unique": True},
+	],
+	"latency_histograms": [
+		{"keys": [("endpoint", ASCENDING), ("granularity", ASCENDING), ("start", ASCENDING)], "unique": True},
+		{"keys": [("granularity", ASCENDING), ("start", ASCENDING)]},
+		{"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+	],
+	"collection_stats_partials": [
+		{"keys": [("job_id", ASCENDING), ("attempt", ASCENDING)]},
+	],
+	"collection_stats_jobs": [
+		{"keys": [("collection_id", ASCENDING), ("created_at", DESCENDING)]},
+		{"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+	],
+	"library_bodies": [
+		{"keys": [("user_id", ASCENDING), ("mongo_id", ASCENDING)], "unique": True},
+	],
+	"library_frequencies": [
+		{"keys": [("user_id", ASCENDING), ("word", ASCENDING)], "unique": True},
+	],
+	"memory_profiles": [
+		{"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+	],
+	"upload_sessions": [
+		{"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+	],
+	"upload_chunks": [
+		{"keys": [("upload_id", ASCENDING), ("offset", ASCENDING)]},
+		{"keys": [("expires_at", ASCENDING)], "expireAfterSeconds": 0},
+	],
+}
+
+# Клиенты создаются лениво, по одному на процесс; после fork (gunicorn --preload, prefork Celery)
+# унаследованные клиенты сбрасываются, и дочерний процесс открывает собственные соединения
+_client = None
+_async_client = None
+
+
+def get_mongo_uri():
 	username = settings.MONGO['USERNAME']
 	password = settings.MONGO['PASSWORD']
 	host = settings.MONGO['HOST']
 	port = settings.MONGO['PORT']
-	db_name = settings.MONGO['DB_NAME']
-
 	uri = f"mongodb://{username}:{password}@{host}:{port}/?authSource=admin"
-	client = MongoClient(uri)
-	return client[db_name]
+	if settings.MONGO['REPLICA_SET']:
+		uri += f"&replicaSet={settings.MONGO['REPLICA_SET']}"
+	return uri
+
+
+def _database(client):
+	# Read-эндпойнты читают с secondary; запись через ту же базу всё равно уходит на primary
+	if replica_reads():
+		read_preference = getattr(ReadPreference, settings.MONGO['READ_PREFERENCE'])
+		return client.get_database(settings.MONGO['DB_NAME'], read_preference=read_preference)
+	return client[settings.MONGO['DB_NAME']]
+
+
+def get_mongo_client():
+	global _client
+	if _client is None:
+		_client = MongoClient(get_mongo_uri(), event_listeners=[MongoTimingListener()])
+	return _client
+
+
+def get_mongo_db():
+	return _database(get_mongo_client())
+
+
+def reset_mongo_clients():
+	# В дочернем процессе соединения родителя не закрываем, а только забываем ссылки на них
+	global _client, _async_client
+	_client = None
+	_async_client = None
+
+
+def close_mongo_clients():
+	if _client is not None:
+		_client.close()
+	reset_mongo_clients()
+
+
+os.register_at_fork(after_in_child=reset_mongo_clients)
+
+
+def get_async_mongo_db():
+	global _async_client
+	if _async_client is None:
+		_async_client = AsyncMongoClient(get_mongo_uri(), event_listeners=[MongoTimingListener()])
+	return _database(_async_client)
+
+
+def get_async_documents_collection():
+	return get_async_mongo_db()["documents"]
+
+
+def ensure_mongo_indexes():
+	db = get_mongo_db()
+	created = []
+	for collection_name, indexes in MONGO_INDEXES.items():
+		for spec in indexes:
+			options = {key: value for key, value in spec.items() if key != "keys"}
+			created.append(f"{collection_name}.{db[collection_name].create_index(spec['keys'], **options)}")
+	return created
 
 
 def get_documents_collection():
 	return get_mongo_db()["documents"]
 
 
+def get_document_body(mongo_id, projection=None):
+	return get_documents_collection().find_one({"_id": ObjectId(mongo_id)}, projection)
+
+
+def content_hash(text):
+	return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_content_bucket():
+	return GridFSBucket(get_mongo_db(), bucket_name="document_contents")
+
+
+def get_async_content_bucket():
+	return AsyncGridFSBucket(get_async_mongo_db(), bucket_name="document_contents")
+
+
+def document_content(body):
+	if "content_file_id" in body:
+		return get_content_bucket().open_download_stream(body["content_file_id"]).read().decode("utf-8")
+	return body.get("content", "")
+
+
+async def async_document_content(body):
+	if "content_file_id" in body:
+		stream = await get_async_content_bucket().open_download_stream(body["content_file_id"])
+		return (await stream.read()).decode("utf-8")
+	return body.get("content", "")
+
+
+def term_counts_to_mongo(counts):
+	return [{"word": word, "count": count} for word, count in sorted(counts.items(), key=word_rank_key)]
+
+
+def term_counts_from_mongo(body):
+	return Counter({entry["word"]: entry["count"] for entry in body.get("term_counts", [])})
+
+
+def document_body_statistics(counts):
+	# term_counts хранится уже отсортированным, поэтому страница рейтинга читается через $slice;
+	# word_stats_count отмечает тела с отсортированным term_counts
+	return {
+		"word_count": sum(counts.values()),
+		"term_counts": term_counts_to_mongo(counts),
+		"word_stats_count": len(counts),
+	}
+
+
+def get_document_word_stats_page(mongo_id, start, page_size):
+	documents_collection = get_documents_collection()
+	body = documents_collection.find_one(
+		{"_id": ObjectId(mongo_id)},
+		{"term_counts": {"$slice": [start, page_size]}, "word_count": 1, "word_stats_count": 1, "word_stats": {"$slice": 1}}
+	)
+	if body is None:
+		return None
+
+	if "word_stats_count" in body and "word_stats" not in body:
+		entries, word_count, total = body.get("term_counts", []), body["word_count"], body["word_stats_count"]
+	else:
+		# Старое тело: term_counts не отсортирован (или его нет) — сортируем один раз и убираем дублирующий word_stats
+		body = documents_collection.find_one({"_id": body["_id"]}, {"term_counts": 1, "content": 1})
+		counts = term_counts_from_mongo(body) if "term_counts" in body else Counter(tokenize(body.get("content", "")))
+		statistics = document_body_statistics(counts)
+		documents_collection.update_one({"_id": body["_id"]}, {"$set": statistics, "$unset": {"word_stats": ""}})
+		entries = statistics["term_counts"][start:start + page_size]
+		word_count, total = statistics["word_count"], statistics["word_stats_count"]
+
+	page = [
+		{"word": entry["word"], "total_tf": round(entry["count"] / word_count, 6) if word_count else 0}
+		for entry in entries
+	]
+	return page, total
+
+
+def get_libraries_collection():
+	return get_mongo_db()["libraries"]
+
+
+def get_library_bodies_collection():
+	return get_mongo_db()["library_bodies"]
+
+
+def get_library_frequencies_collection():
+	return get_mongo_db()["library_frequencies"]
+
+
+def _update_library(user_id, documents, word_deltas):
+	if documents:
+		get_libraries_collection().update_one({"_id": user_id}, {"$inc": {"documents": documents}}, upsert=True)
+
+	frequencies = get_library_frequencies_collection()
+	words = list(word_deltas)
+	for i in range(0, len(words), LIBRARY_BATCH_SIZE):
+		batch = words[i:i + LIBRARY_BATCH_SIZE]
+		frequencies.bulk_write([
+			UpdateOne({"user_id": user_id, "word": word}, {"$inc": {"df": word_deltas[word]}}, upsert=True)
+			for word in batch
+		], ordered=False)
+		if documents < 0:
+			frequencies.delete_many({"user_id": user_id, "word": {"$in": batch}, "df": {"$lte": 0}})
+
+
+def add_library_documents(user_id, mongo_ids, term_counts):
+	# DF по библиотеке пользователя ведётся при записи: тело учитывается один раз, при первой ссылке на него,
+	# поэтому страница статистики документа читает DF только своих слов
+	bodies = get_library_bodies_collection()
+	added = 0
+	word_deltas = Counter()
+	for mongo_id, counts in zip(mongo_ids, term_counts):
+		entry = bodies.find_one_and_update(
+			{"user_id": user_id, "mongo_id": str(mongo_id)},
+			{"$inc": {"refs": 1}},
+			upsert=True,
+			return_document=ReturnDocument.AFTER
+		)
+		if entry["refs"] == 1:
+			added += 1
+			word_deltas.update(counts.keys())
+	_update_library(user_id, added, word_deltas)
+
+
+def remove_library_document(user_id, mongo_id):
+	# Вызывается до release_document_body: слова берутся из тела, которое ещё существует
+	bodies = get_library_bodies_collection()
+	entry = bodies.find_one_and_update(
+		{"user_id": user_id, "mongo_id": str(mongo_id)},
+		{"$inc": {"refs": -1}},
+		return_document=ReturnDocument.AFTER
+	)
+	if not entry or entry["refs"] > 0:
+		return
+	bodies.delete_one({"_id": entry["_id"], "refs": {"$lte": 0}})
+	counts = next(iter_term_counts([mongo_id]), Counter())
+	_update_library(user_id, -1, Counter({word: -1 for word in counts}))
+
+
+def rebuild_library(user_id, mongo_ids):
+	# Полный пересчёт DF библиотеки пользователя по списку его документов (для заполнения и проверки)
+	get_libraries_collection().delete_one({"_id": user_id})
+	get_library_bodies_collection().delete_many({"user_id": user_id})
+	get_library_frequencies_collection().delete_many({"user_id": user_id})
+
+	refs = Counter(str(mongo_id) for mongo_id in mongo_ids)
+	if not refs:
+		return 0
+	get_library_bodies_collection().insert_many(
+		[{"user_id": user_id, "mongo_id": mongo_id, "refs": count} for mongo_id, count in refs.items()]
+	)
+	word_deltas = Counter()
+	for counts in iter_term_counts(list(refs)):
+		word_deltas.update(counts.keys())
+	_update_library(user_id, len(refs), word_deltas)
+	return len(refs)
+
+
+def library_document_frequencies(user_id, words):
+	# (число различных тел в библиотеке пользователя, DF слов страницы)
+	library = get_libraries_collection().find_one({"_id": user_id})
+	rows = get_library_frequencies_collection().find({"user_id": user_id, "word": {"$in": list(words)}})
+	return (library or {}).get("documents", 0), {row["word"]: row["df"] for row in rows}
+
+
+def find_document_bodies(hashes, projection=None):
+	cursor = get_documents_collection().find({"content_hash": {"$in": list(hashes)}}, projection)
+	return {body["content_hash"]: body for body in cursor}
+
+
+def body_too_large(body):
+	# Точный размер тела до записи: term_counts, частоты символов и биграммы вместе с текстом, если он остаётся в теле
+	fields = dict(body)
+	if len(fields["content"].encode("utf-8")) > CONTENT_INLINE_MAX_SIZE:
+		del fields["content"]
+	return len(bson.encode(fields)) > BODY_SIZE_LIMIT
+
+
+def _body_fields(body, bucket, files):
+	fields = {key: value for key, value in body.items() if key != "content_hash"}
+	content = fields["content"].encode("utf-8")
+	if len(content) > CONTENT_INLINE_MAX_SIZE:
+		del fields["content"]
+		fields["content_file_id"] = bucket.upload_from_stream(body.get("file_name", body["content_hash"]), content)
+		files.append(fields["content_file_id"])
+	return fields
+
+
+def store_document_bodies(bodies):
+	# Тело документа адресуется по хэшу содержимого: одинаковые файлы хранятся один раз, ref_count считает ссылки
+	documents_collection = get_documents_collection()
+	bucket = get_content_bucket()
+	files = []
+	try:
+		operations = [
+			UpdateOne(
+				{"content_hash": body["content_hash"]},
+				{"$inc": {"ref_count": 1}, "$setOnInsert": _body_fields(body, bucket, files)},
+				upsert=True
+			)
+			for body in bodies
+		]
+		documents_collection.bulk_write(operations)
+	except Exception:
+		for file_id in files:
+			bucket.delete(file_id)
+		raise
+
+	stored = find_document_bodies(
+		(body["content_hash"] for body in bodies), {"_id": 1, "content_hash": 1, "content_file_id": 1}
+	)
+	# Тело с таким хэшем уже было: загруженная копия текста не понадобилась
+	used = {body["content_file_id"] for body in stored.values() if "content_file_id" in body}
+	for file_id in files:
+		if file_id not in used:
+			bucket.delete(file_id)
+	return [stored[body["content_hash"]]["_id"] for body in bodies]
+
+
+def release_document_body(mongo_id):
+	documents_collection = get_documents_collection()
+	body = documents_collection.find_one_and_update(
+		{"_id": ObjectId(mongo_id)},
+		{"$inc": {"ref_count": -1}},
+		projection={"ref_count": 1, "content_file_id": 1},
+		return_document=ReturnDocument.AFTER
+	)
+	if body and body["ref_count"] <= 0:
+		deleted = documents_collection.delete_one({"_id": body["_id"], "ref_count": {"$lte": 0}})
+		if deleted.deleted_count and "content_file_id" in body:
+			get_content_bucket().delete(body["content_file_id"])
+
+
+HUFFMAN_ARTIFACT_FIELDS = {"char": "huffman", "word": "huffman_word"}
+HUFFMAN_MODES = ("char", "word", "auto")
+
+
+def cached_huffman_codes(body, mode="char"):
+	artifact = body.get(HUFFMAN_ARTIFACT_FIELDS[mode])
+	if artifact and artifact.get("version") == HUFFMAN_ARTIFACT_VERSION:
+		return dict(artifact["codes"])
+	return None
+
+
+def huffman_artifact_update(code_map, mode="char"):
+	return {"$set": {HUFFMAN_ARTIFACT_FIELDS[mode]: {"version": HUFFMAN_ARTIFACT_VERSION, "codes": list(code_map.items())}}}
+
+
+def resolve_huffman_codes(body, mode="char", content=None):
+	# Возвращает (режим, коды, поток символов, обновление для новых кодов или None);
+	# в режиме auto выбирается представление с меньшим размером вместе с таблицей кодов
+	if content is None:
+		content = document_content(body)
+	best = None
+	update = {}
+	for candidate in (("char", "word") if mode == "auto" else (mode,)):
+		symbols = huffman_symbols(content, candidate)
+		code_map = cached_huffman_codes(body, candidate)
+		if code_map is None:
+			# Частоты символов уже посчитаны анализатором при загрузке
+			if candidate == "char" and "char_counts" in body:
+				frequencies = Counter(dict(body["char_counts"]))
+			else:
+				frequencies = Counter(symbols)
+			code_map = build_huffman_codes(frequencies)
+			update.update(huffman_artifact_update(code_map, candidate)["$set"])
+		size = encoded_size(symbols, code_map) + huffman_table_bits(code_map)
+		if best is None or size < best[0]:
+			best = (size, candidate, code_map, symbols)
+
+	_, mode, code_map, symbols = best
+	return mode, code_map, symbols, {"$set": update} if update else None
+
+
+def get_huffman_codes(body, mode="char", content=None):
+	# Коды Хаффмана считаются один раз на тело документа и переиспользуются всеми ссылками на него
+	mode, code_map, symbols, update = resolve_huffman_codes(body, mode, content)
+	if update is not None:
+		try:
+			get_documents_collection().update_one({"_id": body["_id"]}, update)
+		except WriteError as e:
+			# Таблица кодов не поместилась в тело документа: отдаём коды без кэширования
+			if e.code not in DOCUMENT_TOO_LARGE_CODES:
+				raise
+	return mode, code_map, symbols
+
+
+def get_memory_profiles_collection():
+	return get_mongo_db()["memory_profiles"]
+
+
 def get_metrics_collection():
 	return get_mongo_db()["metrics_collection"]
 
 
+def get_collection_statistics_collection():
+	return get_mongo_db()["collection_statistics"]
+
+
+def get_collection_word_stats_page(collection_id, start, page_size):
+	stats = get_collection_statistics_collection().find_one(
+		{"collection_id": collection_id, "top_words_count": {"$exists": True}},
+		{"top_words": {"$slice": [start, page_size]}, "top_words_count": 1, "stale": 1}
+	)
+	if stats is None:
+		return None
+	return stats["top_words"], stats["top_words_count"], stats.get("stale", False)
+
+
 def get_mongo_collections():
 	db = get_mongo_db()
 	return {
@@ -75,47 +522,157 @@ def update_global_metrics(processing_time: float, files_count: int):
 		)
 
 
-def update_collection_statistics_in_mongo(collection):
-	mongo_ids = [doc.mongo_id for doc in collection.documents.all()]
-	documents = list(get_documents_collection().find({
-		"_id": {"$in": [ObjectId(mongo_id) for mongo_id in mongo_ids]}
-	}))
+def mark_collection_statistics_stale(collection_id):
+	get_collection_statistics_collection().update_one(
+		{"collection_id": collection_id},
+		{"$set": {"stale": True}, "$inc": {"dirty_generation": 1}},
+		upsert=True
+	)
 
-	if not documents:
-		raise ValueError("No documents found in MongoDB for this collection.")
 
-	texts = [doc.get("content", "") for doc in documents]
-	tfidf_results, _ = compute_global_tfidf_table(texts)
+def get_collection_statistics_generation(collection_id):
+	stats = get_collection_statistics_collection().find_one({"collection_id": collection_id}, {"dirty_generation": 1})
+	return stats.get("dirty_generation") if stats else None
+
 
-	tf_aggregated = {}
-	for doc in tfidf_results:
-		for entry in doc:
-			word = entry["word"]
-			tf_aggregated[word] = tf_aggregated.get(word, 0) + entry["tf"]
+def mark_collection_statistics_fresh(collection_id, generation):
+	# Сбрасываем флаг, только если за время пересчёта коллекция не менялась снова
+	generation_filter = {"$exists": False} if generation is None else generation
+	get_collection_statistics_collection().update_one(
+		{"collection_id": collection_id, "dirty_generation": generation_filter},
+		{"$set": {"stale": False}}
+	)
 
-	idf_lookup = {entry["word"]: entry["idf"] for entry in tfidf_results[0]}
 
-	tfidf_combined = [
-		{
-			"word": word,
-			"total_tf": round(tf, 6),
-			"idf": round(idf_lookup[word], 6)
-		}
-		for word, tf in tf_aggregated.items()
+def clear_collection_statistics(collection_id, documents_count=0, generation=None):
+	return write_collection_statistics(collection_id, documents_count, [], generation)
+
+
+def delete_collection_statistics(collection_id):
+	get_collection_statistics_collection().delete_one({"collection_id": collection_id})
+
+
+def iter_term_counts(mongo_ids):
+	# Берём сохранённые term_counts; содержимое читаем и токенизируем только для старых документов без них
+	documents_collection = get_documents_collection()
+	legacy = []
+	for body in documents_collection.find({"_id": {"$in": [ObjectId(i) for i in mongo_ids]}}, {"term_counts": 1}):
+		if "term_counts" in body:
+			yield term_counts_from_mongo(body)
+		else:
+			legacy.append(body["_id"])
+
+	if legacy:
+		for body in documents_collection.find({"_id": {"$in": legacy}}, {"content": 1}):
+			yield Counter(tokenize(body.get("content", "")))
+
+
+def new_approximate_document_frequency():
+	return ApproximateDocumentFrequency.from_error_bounds(
+		settings.APPROXIMATE_DF_EPSILON, settings.APPROXIMATE_DF_DELTA, settings.APPROXIMATE_DF_CAPACITY
+	)
+
+
+def write_collection_statistics(collection_id, documents_count, top_words, generation=None):
+	# С generation запись условная: результат пересчёта по более старому поколению не перезаписывает более новый
+	query = {"collection_id": collection_id}
+	fields = {
+		"collection_id": collection_id,
+		"documents_count": documents_count,
+		"top_words": top_words,
+		"top_words_count": len(top_words),
+		# Готовый JSON рейтинга отдаётся клиенту без повторной сериализации
+		"top_words_json": Binary(orjson.dumps(top_words)),
+		"computed_at": datetime.utcnow().isoformat()
+	}
+	if generation is not None:
+		query["computed_generation"] = {"$not": {"$gt": generation}}
+		fields["computed_generation"] = generation
+	result = get_collection_statistics_collection().update_one(query, {"$set": fields}, upsert=generation is None)
+	return bool(result.matched_count or result.upserted_id)
+
+
+def get_collection_statistics_payload(collection_id):
+	stats = get_collection_statistics_collection().find_one(
+		{"collection_id": collection_id, "top_words_json": {"$exists": True}},
+		{"_id": 0, "collection_id": 1, "documents_count": 1, "top_words_json": 1, "stale": 1, "computed_at": 1}
+	)
+	if stats is None:
+		return None
+	payload = {
+		"collection_id": stats["collection_id"],
+		"documents_count": stats["documents_count"],
+		"top_words": orjson.Fragment(bytes(stats["top_words_json"])),
+		"stale": stats.get("stale", False),
+	}
+	if "computed_at" in stats:
+		payload["computed_at"] = stats["computed_at"]
+	return payload
+
+
+def backfill_term_counts(mongo_ids):
+	# Старые тела без term_counts токенизируем один раз и дописываем, чтобы дальше их агрегировал Mongo
+	documents_collection = get_documents_collection()
+	legacy = documents_collection.find(
+		{"_id": {"$in": mongo_ids}, "term_counts": {"$exists": False}}, {"content": 1}
+	)
+	operations = [
+		UpdateOne({"_id": body["_id"]}, {"$set": {"term_counts": term_counts_to_mongo(Counter(tokenize(body.get("content", ""))))}})
+		for body in legacy
 	]
+	if operations:
+		documents_collection.bulk_write(operations, ordered=False)
 
-	top_words = sorted(tfidf_combined, key=lambda x: x["idf"], reverse=True)[:50]
 
-	collection_stats_collection = get_mongo_db()["collection_statistics"]
-	collection_stats_collection.update_one(
-		{"collection_id": collection.id},
-		{
-			"$set": {
-				"collection_id": collection.id,
-				"documents_count": len(documents),
-				"top_words": top_words,
-				"computed_at": datetime.utcnow().isoformat()
+def compute_collection_top_words(mongo_ids, limit=50):
+	# DF и сумма TF по словам считаются в Mongo; в Django приходят только итоговые limit строк
+	object_ids = [ObjectId(i) for i in mongo_ids]
+	documents_collection = get_documents_collection()
+	with phase("fetch"):
+		backfill_term_counts(object_ids)
+		documents_count = documents_collection.count_documents({"_id": {"$in": object_ids}})
+	if not documents_count:
+		return 0, []
+
+	with phase("tfidf"):
+		rows = documents_collection.aggregate([
+			{"$match": {"_id": {"$in": object_ids}}},
+			{"$project": {"term_counts": 1, "total": {"$sum": "$term_counts.count"}}},
+			{"$unwind": "$term_counts"},
+			{"$group": {
+				"_id": "$term_counts.word",
+				"df": {"$sum": 1},
+				"tf_sum": {"$sum": {"$divide": ["$term_counts.count", "$total"]}},
+			}},
+			{"$sort": {"df": 1, "_id": 1}},
+			{"$limit": limit},
+		], allowDiskUse=True)
+
+		top_words = [
+			{
+				"word": row["_id"],
+				"total_tf": round(row["tf_sum"], 6),
+				"idf": round(math.log(documents_count / row["df"]), 6)
 			}
-		},
-		upsert=True
-	)
+			for row in rows
+		]
+
+	return documents_count, top_words
+
+
+def update_collection_statistics_in_mongo(collection, generation=None):
+	mongo_ids = list(collection.documents.values_list('mongo_id', flat=True))
+
+	if settings.APPROXIMATE_DF:
+		approximate_df = new_approximate_document_frequency()
+		with phase("tfidf"):
+			for counts in iter_term_counts(mongo_ids):
+				approximate_df.add_document(counts)
+		if not approximate_df.documents:
+			raise ValueError("No documents found in MongoDB for this collection.")
+		return write_collection_statistics(collection.id, approximate_df.documents, approximate_df.top_words(), generation)
+
+	documents_count, top_words = compute_collection_top_words(mongo_ids)
+	if not documents_count:
+		raise ValueError("No documents found in MongoDB for this collection.")
+	return write_collection_statistics(collection.id, documents_count, top_words, generation)
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class IdCursorPagination(CursorPagination):
+	# Keyset-пагинация по (-id): каждая страница — это WHERE id < cursor LIMIT n, без COUNT(*) и OFFSET
+	ordering = '-id'
+	page_size = 20
+	total_query_param = 'with_total'
+	total_cache_timeout = 60
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.approximate_total = None
+		if request.query_params.get(self.total_query_param) in ('1', 'true'):
+			self.approximate_total = self.get_approximate_total(queryset, request)
+		return super().paginate_queryset(queryset, request, view)
+
+	def get_approximate_total(self, queryset, request):
+		# Общее число считается не чаще раза в total_cache_timeout секунд на пользователя
+		key = f"cursor_total:{queryset.model._meta.model_name}:{request.user.id}"
+		total = cache.get(key)
+		if total is None:
+			total = queryset.count()
+			cache.set(key, total, timeout=self.total_cache_timeout)
+		return total
+
+	def get_paginated_response(self, data):
+		payload = {
+			'next': self.get_next_link(),
+			'previous': self.get_previous_link(),
+			'results': data,
+		}
+		if self.approximate_total is not None:
+			payload['approximate_total'] = self.approximate_total
+		return Response(payload)
+
+	def get_paginated_response_schema(self, schema):
+		response_schema = super().get_paginated_response_schema(schema)
+		response_schema['properties']['approximate_total'] = {'type': 'integer', 'nullable': True}
+		return response_schema
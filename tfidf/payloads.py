@@ -0,0 +1,22 @@
+from collections import defaultdict
+
+from .models import Collection
+
+
+# Тот же JSON, что и CollectionSerializer, но из values()-запросов без построения моделей и полей сериализатора
+def collection_detail_payload(collection):
+	documents = list(
+		collection.documents.order_by('id').values('id', 'name', 'size', 'word_count', 'created_at', 'mongo_id')
+	)
+
+	memberships = defaultdict(list)
+	rows = Collection.documents.through.objects.filter(
+		document__collections=collection
+	).order_by('collection_id').values_list('document_id', 'collection_id', 'collection__name')
+	for document_id, collection_id, name in rows:
+		memberships[document_id].append({"id": collection_id, "name": name})
+
+	for document in documents:
+		document["collections"] = memberships[document["id"]]
+
+	return {"id": collection.id, "name": collection.name, "documents": documents}
@@ -0,0 +1,100 @@
+import threading
+import tracemalloc
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PROFILE_HEADER = "X-Memory-Profile"
+TOP_SITES = 10
+
+_current_profile = ContextVar("memory_profile", default=None)
+# tracemalloc общий на процесс, поэтому одновременно профилируется только один запрос
+_profiling_lock = threading.Lock()
+
+
+def _snapshot():
+	return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def _kb(size):
+	return round(size / 1024, 1)
+
+
+class MemoryProfile:
+	def __init__(self):
+		self.stack = []
+		self.phases = []
+
+	def _fold_peak(self):
+		# reset_peak во вложенной фазе не должен терять пик внешних фаз
+		peak = tracemalloc.get_traced_memory()[1]
+		for frame in self.stack:
+			frame["peak"] = max(frame["peak"], peak)
+
+	def enter(self, name):
+		self._fold_peak()
+		tracemalloc.reset_peak()
+		current = tracemalloc.get_traced_memory()[0]
+		self.stack.append({"name": name, "start": current, "peak": current, "snapshot": _snapshot()})
+
+	def exit(self):
+		self._fold_peak()
+		frame = self.stack.pop()
+		current = tracemalloc.get_traced_memory()[0]
+		top = _snapshot().compare_to(frame["snapshot"], "lineno")[:TOP_SITES]
+		self.phases.append({
+			"phase": frame["name"],
+			"peak_kb": _kb(frame["peak"] - frame["start"]),
+			"retained_kb": _kb(current - frame["start"]),
+			"top_sites": [
+				{"site": str(stat.traceback[0]), "size_kb": _kb(stat.size_diff), "count": stat.count_diff}
+				for stat in top if stat.size_diff > 0
+			],
+		})
+
+
+def current_memory_profile():
+	return _current_profile.get()
+
+
+def profiling_requested(request):
+	if settings.MEMORY_PROFILING_ENABLED:
+		return True
+	token = settings.MEMORY_PROFILING_TOKEN
+	return bool(token) and request.headers.get(PROFILE_HEADER) == token
+
+
+def start_memory_profile():
+	if not _profiling_lock.acquire(blocking=False):
+		return None
+	started_here = not tracemalloc.is_tracing()
+	if started_here:
+		tracemalloc.start()
+	tracemalloc.reset_peak()
+	profile = MemoryProfile()
+	return profile, _current_profile.set(profile), started_here
+
+
+def stop_memory_profile(state):
+	profile, token, started_here = state
+	_current_profile.reset(token)
+	try:
+		peak = tracemalloc.get_traced_memory()[1]
+		if started_here:
+			tracemalloc.stop()
+	finally:
+		_profiling_lock.release()
+	return profile, peak
+
+
+def memory_profile_report(request, response, profile, peak):
+	match = request.resolver_match
+	return {
+		"method": request.method,
+		"path": request.path,
+		"route": f"/{match.route}" if match is not None else None,
+		"status": response.status_code,
+		"content_length": request.META.get("CONTENT_LENGTH"),
+		"peak_kb": _kb(peak),
+		"phases": profile.phases,
+	}
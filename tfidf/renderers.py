@@ -0,0 +1,25 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .timing import phase
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+	# Decimal, UUID, lazy-строки и прочее, что orjson не знает, сериализуем как DRF
+	return _encoder.default(obj)
+
+
+def dumps(data):
+	return orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONRenderer(JSONRenderer):
+	# orjson.Fragment с готовыми JSON-байтами вставляется в ответ как есть, без повторной сериализации
+	def render(self, data, accepted_media_type=None, renderer_context=None):
+		if data is None:
+			return b''
+		with phase("render"):
+			return dumps(data)
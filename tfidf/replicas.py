@@ -0,0 +1,52 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+
+def replica_reads():
+	return _replica_reads.get()
+
+
+@contextmanager
+def read_from_replica():
+	token = _replica_reads.set(True)
+	try:
+		yield
+	finally:
+		_replica_reads.reset(token)
+
+
+def _recent_write_key(user_id):
+	return f"replica:recent_write:{user_id}"
+
+
+def mark_recent_write(user):
+	cache.set(_recent_write_key(user.id), 1, timeout=settings.REPLICA_READ_YOUR_WRITES_SECONDS)
+
+
+def can_read_from_replica(request):
+	# После собственной записи пользователь какое-то время читает с primary, чтобы не увидеть отставшую реплику
+	user = request.user
+	if request.method not in SAFE_METHODS or not user or not user.is_authenticated:
+		return False
+	return not cache.get(_recent_write_key(user.id))
+
+
+class ReplicaReadMixin:
+	# Для read-эндпойнтов: после аутентификации запросы к PostgreSQL и Mongo уходят на реплики
+	def initial(self, request, *args, **kwargs):
+		super().initial(request, *args, **kwargs)
+		if can_read_from_replica(request):
+			self._replica_token = _replica_reads.set(True)
+
+	def finalize_response(self, request, response, *args, **kwargs):
+		token = getattr(self, "_replica_token", None)
+		if token is not None:
+			_replica_reads.reset(token)
+			self._replica_token = None
+		return super().finalize_response(request, response, *args, **kwargs)
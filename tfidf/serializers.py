@@ -1,11 +1,18 @@
+import base64
+import binascii
 from datetime import datetime
+from django.conf import settings
+from .analysis import analyze_texts
+from .archives import ArchiveError, ExtractionBudget, is_archive, iter_archive_members
+from .histograms import record_latency
 from .mongo import update_global_metrics
 import time
-from bson import ObjectId
 from rest_framework import serializers
 from .models import Document, Collection
-from .mongo import get_documents_collection
-from .utils import compute_global_tfidf_table
+from .mongo import content_hash, find_document_bodies, store_document_bodies, term_counts_from_mongo, \
+	compute_collection_top_words, add_library_documents, body_too_large
+from .timing import phase
+from .utils import compute_tfidf_from_counts, HuffmanDecoder
 
 
 class TFIDFUploadSerializer(serializers.Serializer):
@@ -16,53 +23,107 @@ class TFIDFUploadSerializer(serializers.Serializer):
 	)
 
 	def validate(self, data):
-		decoded_texts = []
-		for f in data['files']:
+		# Файлы, которые не удалось прочитать, пропускаем с ошибкой, а не отклоняем весь батч
+		entries = []
+		errors = []
+		budget = ExtractionBudget(settings.ARCHIVE_MAX_TOTAL_SIZE)
+		with phase("decode"):
+			for f in data['files']:
+				if is_archive(f.name):
+					try:
+						for name, raw, error in iter_archive_members(f, budget):
+							self._add_entry(entries, errors, name[:255], raw, error)
+							del raw
+					except ArchiveError as e:
+						errors.append({"file_name": f.name, "error": str(e)})
+				else:
+					self._add_entry(entries, errors, f.name, f.read(), None)
+					f.seek(0)
+
+		if not entries:
+			raise serializers.ValidationError({"files": "No UTF-8 text files to process.", "errors": errors})
+		data['entries'] = entries
+		data['errors'] = errors
+		return data
+
+	@staticmethod
+	def _add_entry(entries, errors, name, raw, error):
+		if error is None:
 			try:
-				content = f.read().decode('utf-8').strip()
-				decoded_texts.append(content)
-				f.seek(0)
+				entries.append({"name": name, "size": len(raw), "text": raw.decode('utf-8').strip()})
+				return
 			except UnicodeDecodeError:
-				raise serializers.ValidationError(f"File '{f.name}' is not UTF-8 encoded.")
-		data['decoded_texts'] = decoded_texts
-		return data
+				error = f"File '{name}' is not UTF-8 encoded."
+		errors.append({"file_name": name, "error": error})
 
 	def create(self, validated_data):
 		user = self.context['request'].user
-		files = validated_data['files']
-		texts = validated_data['decoded_texts']
+		entries = validated_data['entries']
+		texts = [entry['text'] for entry in entries]
 
 		start_time = time.time()
-		# Считаем TF-IDF, но не сохраняем в БД
-		tfidf_results, word_counts = compute_global_tfidf_table(texts)
-		now = datetime.utcnow().isoformat()
+		hashes = [content_hash(text) for text in texts]
+		with phase("fetch"):
+			stored = find_document_bodies(hashes, {"content_hash": 1, "term_counts": 1})
+
+		# Анализируем (за один проход по тексту) только содержимое, которого ещё нет в Mongo
+		with phase("tokenize"):
+			new_texts = [text for text, h in zip(texts, hashes) if h not in stored]
+			analyzed = iter(analyze_texts(new_texts))
+			term_counts = []
+			body_fields = []
+			for h in hashes:
+				if h in stored:
+					term_counts.append(term_counts_from_mongo(stored[h]))
+					body_fields.append({})
+				else:
+					counts, fields = next(analyzed)
+					term_counts.append(counts)
+					body_fields.append(fields)
 
-		documents_collection = get_documents_collection()
+		now = datetime.utcnow().isoformat()
+		# Для уже сохранённых тел статистика не нужна: store_document_bodies пишет поля только при вставке
+		bodies = [{
+			"content_hash": h,
+			"file_name": entry['name'],
+			"file_size": entry['size'],
+			"content": entry['text'],
+			"uploaded_at": now,
+			**fields
+		} for entry, h, fields in zip(entries, hashes, body_fields)]
+
+		# Тело, которое не уложится в лимит BSON, пропускаем с ошибкой, а не роняем весь батч
+		errors = list(validated_data['errors'])
+		kept = []
+		for i, (entry, fields) in enumerate(zip(entries, body_fields)):
+			if fields and body_too_large(bodies[i]):
+				errors.append({"file_name": entry['name'], "error": "File statistics exceed the maximum document size."})
+			else:
+				kept.append(i)
+		entries = [entries[i] for i in kept]
+		term_counts = [term_counts[i] for i in kept]
+		bodies = [bodies[i] for i in kept]
 
-		# В Mongo сохраняем только контент без статистики
-		documents = [{
-			"file_name": f.name,
-			"file_size": f.size,
-			"word_count": wc,
-			"content": text,  # только содержимое
-			"uploaded_at": now
-		} for f, text, wc in zip(files, texts, word_counts)]
+		# Считаем TF-IDF, но не сохраняем в БД
+		with phase("tfidf"):
+			tfidf_results, word_counts = compute_tfidf_from_counts(term_counts)
 
-		result = documents_collection.insert_many(documents)
-		inserted_ids = result.inserted_ids
+		inserted_ids = store_document_bodies(bodies) if bodies else []
 
 		# В PostgreSQL сохраняем метаданные (тоже без tfidf_data)
-		for f, wc, mongo_id in zip(files, word_counts, inserted_ids):
+		for entry, wc, mongo_id in zip(entries, word_counts, inserted_ids):
 			Document.objects.create(
 				user=user,
-				name=f.name,
-				size=f.size,
+				name=entry['name'],
+				size=entry['size'],
 				word_count=wc,
 				mongo_id=str(mongo_id)
 			)
+		add_library_documents(user.id, inserted_ids, term_counts)
 
 		processing_time = round(time.time() - start_time, 3)
-		update_global_metrics(processing_time, len(files))
+		update_global_metrics(processing_time, len(entries))
+		record_latency("upload_processing", processing_time * 1000)
 
 		# Выводим топ-50 слов по TF-IDF из расчёта (не из БД)
 		top_words = []
@@ -79,20 +140,41 @@ class TFIDFUploadSerializer(serializers.Serializer):
 			"files": [
 				{
 					"file_id": str(fid),
-					"file_name": f.name,
-					"file_size": f.size,
+					"file_name": entry['name'],
+					"file_size": entry['size'],
 					"word_count": wc
 				}
-				for f, wc, fid in zip(files, word_counts, inserted_ids)
+				for entry, wc, fid in zip(entries, word_counts, inserted_ids)
 			],
+			"errors": errors,
 			"top_words": top_words
 		}
 
 
-class TfidfEntrySerializer(serializers.Serializer):
-	word = serializers.CharField()
-	tf = serializers.FloatField(source='total_tf')
-	idf = serializers.FloatField()
+class ChunkedUploadInitSerializer(serializers.Serializer):
+	file_name = serializers.CharField(max_length=255)
+
+
+class HuffmanDecodeSerializer(serializers.Serializer):
+	codes = serializers.DictField(child=serializers.CharField(max_length=64), allow_empty=False)
+	data = serializers.CharField(allow_blank=True, trim_whitespace=False)
+	bit_length = serializers.IntegerField(min_value=0)
+	document_id = serializers.IntegerField(required=False)
+
+	def validate_data(self, value):
+		try:
+			return base64.b64decode(value, validate=True)
+		except (binascii.Error, ValueError):
+			raise serializers.ValidationError("Bitstream must be base64 encoded.")
+
+	def validate(self, data):
+		if data['bit_length'] > len(data['data']) * 8:
+			raise serializers.ValidationError("bit_length exceeds the bitstream size.")
+		try:
+			data['decoder'] = HuffmanDecoder(data['codes'])
+		except ValueError as e:
+			raise serializers.ValidationError({"codes": str(e)})
+		return data
 
 
 class CollectionSampleSerializer(serializers.ModelSerializer):
@@ -101,32 +183,6 @@ class CollectionSampleSerializer(serializers.ModelSerializer):
 		fields = ['id', 'name']
 
 
-class DocumentStatisticsSerializer(serializers.Serializer):
-	id = serializers.IntegerField()
-	name = serializers.CharField()
-	word_count = serializers.IntegerField()
-	file_size = serializers.IntegerField(source="size")
-	uploaded_at = serializers.DateTimeField(source="created_at")
-	collections = CollectionSampleSerializer(many=True)
-	tfidf_data = TfidfEntrySerializer(many=True)
-
-	def to_representation(self, instance):
-		mongo_doc = instance
-		document = self.context["document"]
-
-		base = super().to_representation({
-			"id": document.id,
-			"name": document.name,
-			"size": document.size,
-			"word_count": document.word_count,
-			"created_at": document.created_at,
-			"collections": document.collections.all(),
-			"tfidf_data": mongo_doc.get("tfidf_data", [])
-		})
-
-		return base
-
-
 class DocumentSerializer(serializers.ModelSerializer):
 	collections = CollectionSampleSerializer(read_only=True, many=True)
 
@@ -147,51 +203,62 @@ class CollectionCreateSerializer(serializers.Serializer):
 	name = serializers.CharField(max_length=255)
 
 
+class CollectionMembershipSerializer(serializers.Serializer):
+	add = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+	remove = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+	def validate(self, data):
+		add, remove = set(data['add']), set(data['remove'])
+		if not add and not remove:
+			raise serializers.ValidationError("Provide document ids to add and/or remove.")
+		if add & remove:
+			raise serializers.ValidationError(f"Documents cannot be both added and removed: {sorted(add & remove)}")
+
+		user = self.context['request'].user
+		owned = set(Document.objects.filter(user=user, id__in=add | remove).values_list('id', flat=True))
+		missing = sorted((add | remove) - owned)
+		if missing:
+			raise serializers.ValidationError(f"Documents not found: {missing}")
+
+		data['add'], data['remove'] = sorted(add), sorted(remove)
+		return data
+
+
+class WordStatsPageSerializer(serializers.Serializer):
+	# Слишком большая страница не отклоняется, а обрезается до MAX_PAGE_SIZE
+	MAX_PAGE_SIZE = 1000
+
+	page = serializers.IntegerField(min_value=1, default=1)
+	page_size = serializers.IntegerField(min_value=1, default=50)
+
+	def validate_page_size(self, value):
+		return min(value, self.MAX_PAGE_SIZE)
+
+
 class WordStatsSerializer(serializers.Serializer):
 	word = serializers.CharField()
 	total_tf = serializers.FloatField()
 	idf = serializers.FloatField()
+	# Только для приближённого DF: False, если total_tf — нижняя граница
+	total_tf_exact = serializers.BooleanField(required=False)
 
 
 class CollectionStatisticsSerializer(serializers.Serializer):
 	collection_id = serializers.IntegerField()
 	documents_count = serializers.IntegerField()
 	top_words = WordStatsSerializer(many=True)
+	stale = serializers.BooleanField(default=False)
+	computed_at = serializers.CharField(required=False)
 
 	@classmethod
 	def from_collection(cls, collection: Collection):
-		mongo_ids = [doc.mongo_id for doc in collection.documents.all()]
-		documents = list(get_documents_collection().find({
-			"_id": {"$in": [ObjectId(mongo_id) for mongo_id in mongo_ids]}
-		}))
-
-		if not documents:
+		mongo_ids = list(collection.documents.values_list('mongo_id', flat=True))
+		documents_count, top_words = compute_collection_top_words(mongo_ids)
+		if not documents_count:
 			raise serializers.ValidationError("No documents found in MongoDB")
 
-		texts = [doc.get("content", "") for doc in documents]
-		tfidf_results, _ = compute_global_tfidf_table(texts)
-
-		tf_aggregated = {}
-		for doc in tfidf_results:
-			for entry in doc:
-				word = entry["word"]
-				tf_aggregated[word] = tf_aggregated.get(word, 0) + entry["tf"]
-
-		idf_lookup = {entry["word"]: entry["idf"] for entry in tfidf_results[0]}
-
-		tfidf_combined = [
-			{
-				"word": word,
-				"total_tf": round(tf, 6),
-				"idf": round(idf_lookup[word], 6)
-			}
-			for word, tf in tf_aggregated.items()
-		]
-
-		tfidf_sorted = sorted(tfidf_combined, key=lambda x: x["idf"], reverse=True)[:50]
-
 		return cls({
 			"collection_id": collection.id,
-			"documents_count": len(documents),
-			"top_words": tfidf_sorted
+			"documents_count": documents_count,
+			"top_words": top_words
 		})
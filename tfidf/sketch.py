@@ -0,0 +1,150 @@
+import hashlib
+import math
+from array import array
+
+from bson import Binary
+
+
+class CountMinSketch:
+	# Оценка никогда не занижает частоту и с вероятностью 1 - delta завышает её не более чем на epsilon * total
+	def __init__(self, width, depth, table=None, total=0):
+		self.width = width
+		self.depth = depth
+		self.table = table if table is not None else array("I", bytes(4 * width * depth))
+		self.total = total
+
+	@classmethod
+	def from_error_bounds(cls, epsilon, delta):
+		return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+	def _indexes(self, item):
+		digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+		h1 = int.from_bytes(digest[:8], "little")
+		h2 = int.from_bytes(digest[8:], "little") | 1
+		width = self.width
+		return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+	def add(self, item, count=1):
+		table = self.table
+		for index in self._indexes(item):
+			table[index] += count
+		self.total += count
+
+	def estimate(self, item):
+		table = self.table
+		return min(table[index] for index in self._indexes(item))
+
+	def merge(self, other):
+		if (self.width, self.depth) != (other.width, other.depth):
+			raise ValueError("Cannot merge sketches with different dimensions.")
+		table = self.table
+		for index, value in enumerate(other.table):
+			if value:
+				table[index] += value
+		self.total += other.total
+		return self
+
+	def to_mongo(self):
+		return {
+			"width": self.width,
+			"depth": self.depth,
+			"total": self.total,
+			"table": Binary(self.table.tobytes()),
+		}
+
+	@classmethod
+	def from_mongo(cls, data):
+		table = array("I")
+		table.frombytes(bytes(data["table"]))
+		return cls(data["width"], data["depth"], table, data["total"])
+
+
+class ApproximateDocumentFrequency:
+	# DF всех слов хранится в Count-Min Sketch, а точный TF держим только для ограниченного
+	# набора кандидатов с наименьшим DF — именно они попадают в топ по IDF.
+	# Слово, вытесненное из кандидатов и встреченное снова, теряет TF прошлых документов (в т.ч. в других шардах),
+	# поэтому для кандидата считаем и документы, в которых учтён его TF: если их меньше оценки DF,
+	# total_tf — только нижняя граница (total_tf_exact=False)
+	def __init__(self, sketch, capacity, candidates=None, documents=0):
+		self.sketch = sketch
+		self.capacity = capacity
+		# слово -> [сумма TF, число учтённых документов]
+		self.candidates = candidates if candidates is not None else {}
+		self.documents = documents
+
+	@classmethod
+	def from_error_bounds(cls, epsilon, delta, capacity):
+		return cls(CountMinSketch.from_error_bounds(epsilon, delta), capacity)
+
+	def add_document(self, term_counts):
+		self.documents += 1
+		total_words = sum(term_counts.values())
+		if not total_words:
+			return
+
+		candidates = self.candidates
+		for word, count in term_counts.items():
+			self.sketch.add(word)
+			candidate = candidates.get(word)
+			if candidate is None:
+				candidates[word] = [count / total_words, 1]
+			else:
+				candidate[0] += count / total_words
+				candidate[1] += 1
+
+		if len(candidates) > 2 * self.capacity:
+			self._prune()
+
+	def _prune(self):
+		estimate = self.sketch.estimate
+		ranked = sorted(self.candidates.items(), key=lambda item: (estimate(item[0]), item[0]))
+		self.candidates = dict(ranked[:self.capacity])
+
+	def merge(self, other):
+		self.sketch.merge(other.sketch)
+		for word, (tf_sum, counted) in other.candidates.items():
+			candidate = self.candidates.get(word)
+			if candidate is None:
+				self.candidates[word] = [tf_sum, counted]
+			else:
+				candidate[0] += tf_sum
+				candidate[1] += counted
+		self.documents += other.documents
+		self._prune()
+		return self
+
+	def top_words(self, k=50):
+		self._prune()
+		documents = self.documents
+		result = []
+		for word, (tf_sum, counted) in list(self.candidates.items())[:k]:
+			estimated_df = self.sketch.estimate(word)
+			df = min(max(estimated_df, 1), documents)
+			result.append({
+				"word": word,
+				"total_tf": round(tf_sum, 6),
+				"idf": round(math.log(documents / df), 6),
+				# Оценка DF не занижает, поэтому при равенстве TF учтён во всех документах со словом
+				"total_tf_exact": counted >= estimated_df,
+			})
+		return result
+
+	def to_mongo(self):
+		return {
+			"sketch": self.sketch.to_mongo(),
+			"capacity": self.capacity,
+			"documents": self.documents,
+			"candidates": [
+				{"word": word, "tf_sum": tf_sum, "documents": counted}
+				for word, (tf_sum, counted) in self.candidates.items()
+			],
+		}
+
+	@classmethod
+	def from_mongo(cls, data):
+		return cls(
+			CountMinSketch.from_mongo(data["sketch"]),
+			data["capacity"],
+			{entry["word"]: [entry["tf_sum"], entry.get("documents", 0)] for entry in data["candidates"]},
+			data["documents"],
+		)
@@ -0,0 +1,92 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+JSON_CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+STREAM_FORMATS = ("json", "ndjson")
+CHUNK_SIZE = 64 * 1024
+_END = object()
+
+
+def get_stream_format(request):
+	value = request.GET.get("stream", "").lower()
+	if value in ("1", "true"):
+		return "json"
+	if value in STREAM_FORMATS:
+		return value
+	return None
+
+
+def _dumps(value):
+	return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _buffered(parts):
+	# Склеиваем мелкие куски, чтобы не отдавать по одной записи на chunk
+	buffer = []
+	size = 0
+	for part in parts:
+		buffer.append(part)
+		size += len(part)
+		if size >= CHUNK_SIZE:
+			yield "".join(buffer)
+			buffer = []
+			size = 0
+	if buffer:
+		yield "".join(buffer)
+
+
+def iter_json(header, items_key, items):
+	def parts():
+		head = _dumps(header)
+		yield head[:-1] + ("," if header else "") + _dumps(items_key) + ":["
+		for i, item in enumerate(items):
+			yield ("," if i else "") + _dumps(item)
+		yield "]}"
+
+	return _buffered(parts())
+
+
+def iter_ndjson(header, items_key, items):
+	def parts():
+		yield _dumps(header) + "\n"
+		for item in items:
+			yield _dumps({items_key: item}) + "\n"
+
+	return _buffered(parts())
+
+
+def iter_json_string(header, string_key, chunks):
+	# Значение string_key пишется по частям; chunks должны быть уже безопасны для JSON-строки
+	def parts():
+		head = _dumps(header)
+		yield head[:-1] + ("," if header else "") + _dumps(string_key) + ':"'
+		yield from chunks
+		yield '"}'
+
+	return _buffered(parts())
+
+
+def streaming_response(stream_format, header, items_key, items):
+	if stream_format == "ndjson":
+		return StreamingHttpResponse(iter_ndjson(header, items_key, items), content_type=NDJSON_CONTENT_TYPE)
+	return StreamingHttpResponse(iter_json(header, items_key, items), content_type=JSON_CONTENT_TYPE)
+
+
+async def iter_async(parts):
+	# Синхронный итератор ASGI-обработчик Django собирает целиком через sync_to_async(list) до отправки первого байта;
+	# здесь каждый кусок готовится отдельно вне event loop и сразу уходит клиенту
+	next_part = sync_to_async(next, thread_sensitive=False)
+	while True:
+		part = await next_part(parts, _END)
+		if part is _END:
+			return
+		yield part
+
+
+def async_streaming_response(stream_format, header, items_key, items):
+	if stream_format == "ndjson":
+		return StreamingHttpResponse(iter_async(iter_ndjson(header, items_key, items)), content_type=NDJSON_CONTENT_TYPE)
+	return StreamingHttpResponse(iter_async(iter_json(header, items_key, items)), content_type=JSON_CONTENT_TYPE)
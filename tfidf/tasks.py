@@ -0,0 +1,71 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .distributed import start_distributed_statistics
+from .models import Collection
+from .mongo import mark_collection_statistics_stale, get_collection_statistics_generation, \
+	mark_collection_statistics_fresh, update_collection_statistics_in_mongo, clear_collection_statistics, \
+	delete_collection_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def _scheduled_key(collection_id):
+	return f"collection_stats:scheduled:{collection_id}"
+
+
+def _lock_key(collection_id):
+	return f"collection_stats:lock:{collection_id}"
+
+
+def _enqueue(collection_id):
+	# Все изменения в пределах окна debounce сливаются в одну задачу
+	debounce = settings.COLLECTION_STATS_DEBOUNCE_SECONDS
+	if cache.add(_scheduled_key(collection_id), True, timeout=debounce + settings.COLLECTION_STATS_LOCK_TIMEOUT):
+		recompute_collection_statistics.apply_async((collection_id,), countdown=debounce)
+
+
+def schedule_collection_recompute(collection_id):
+	mark_collection_statistics_stale(collection_id)
+	_enqueue(collection_id)
+
+
+@shared_task
+def recompute_collection_statistics(collection_id):
+	cache.delete(_scheduled_key(collection_id))
+
+	lock = cache.lock(_lock_key(collection_id), timeout=settings.COLLECTION_STATS_LOCK_TIMEOUT)
+	if not lock.acquire(blocking=False):
+		# Пересчёт этой коллекции уже идёт, повторим после него
+		_enqueue(collection_id)
+		return
+
+	try:
+		collection = Collection.objects.filter(id=collection_id).first()
+		if collection is None:
+			delete_collection_statistics(collection_id)
+			return
+
+		generation = get_collection_statistics_generation(collection_id)
+		documents_count = collection.documents.count()
+		if documents_count >= settings.DISTRIBUTED_STATS_MIN_DOCUMENTS:
+			# Большие коллекции считаются по шардам на нескольких воркерах, флаг stale снимет reduce-задача;
+			# lock снимается сразу, поэтому reduce устаревшего задания не перезапишет результат более нового
+			start_distributed_statistics(collection, generation)
+			return
+
+		if documents_count:
+			written = update_collection_statistics_in_mongo(collection, generation)
+		else:
+			written = clear_collection_statistics(collection_id, generation=generation)
+		if written:
+			mark_collection_statistics_fresh(collection_id, generation)
+			Collection.objects.filter(id=collection_id).touch()
+	except Exception:
+		logger.exception("Failed to recompute statistics for collection %s", collection_id)
+		raise
+	finally:
+		lock.release()
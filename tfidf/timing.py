@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .profiling import current_memory_profile
+
+_current_timings = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.phases = {}
+
+	def add(self, name, seconds):
+		entry = self.phases.setdefault(name, [0.0, 0])
+		entry[0] += seconds * 1000
+		entry[1] += 1
+
+	def total_ms(self):
+		return (time.perf_counter() - self.started) * 1000
+
+	def sql_wrapper(self, execute, sql, params, many, context):
+		start = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.add("db", time.perf_counter() - start)
+
+	def header(self):
+		entries = [
+			f'{name};dur={duration:.1f};desc="{count}x"'
+			for name, (duration, count) in self.phases.items()
+		]
+		entries.append(f"total;dur={self.total_ms():.1f}")
+		return ", ".join(entries)
+
+	def as_dict(self):
+		return {
+			name: {"ms": round(duration, 1), "count": count}
+			for name, (duration, count) in self.phases.items()
+		}
+
+
+def start_request_timings():
+	timings = RequestTimings()
+	return timings, _current_timings.set(timings)
+
+
+def stop_request_timings(token):
+	_current_timings.reset(token)
+
+
+def current_timings():
+	return _current_timings.get()
+
+
+@contextmanager
+def phase(name):
+	timings = _current_timings.get()
+	profile = current_memory_profile()
+	if timings is None and profile is None:
+		yield
+		return
+
+	# Снимки tracemalloc делаются вне замера, чтобы не искажать Server-Timing
+	if profile is not None:
+		profile.enter(name)
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		if timings is not None:
+			timings.add(name, time.perf_counter() - start)
+		if profile is not None:
+			profile.exit()
+
@@ -0,0 +1,234 @@
+import codecs
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+from bson import Binary
+from django.conf import settings
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DocumentTooLarge
+
+from .analysis import Analyzer
+from .models import Document
+from .histograms import record_latency
+from .mongo import get_mongo_db, content_hash, store_document_bodies, update_global_metrics, DOCUMENT_TOO_LARGE_CODES, \
+	CONTENT_INLINE_MAX_SIZE, BODY_SIZE_LIMIT, add_library_documents, term_counts_from_mongo
+
+# Большой текст уходит в GridFS, поэтому лимит BSON ограничивает только статистику: из тела вычитаем место
+# под текст, который ещё хранится внутри. Та же оценка ограничивает и документ сессии,
+# где копятся счётчики слов, символов и биграмм
+STATISTICS_SIZE_LIMIT = BODY_SIZE_LIMIT - CONTENT_INLINE_MAX_SIZE
+TERM_ENTRY_OVERHEAD = 32
+
+
+class UploadError(Exception):
+	def __init__(self, message, status=400, session=None):
+		super().__init__(message)
+		self.status = status
+		self.session = session
+
+
+def get_upload_sessions_collection():
+	return get_mongo_db()["upload_sessions"]
+
+
+def get_upload_chunks_collection():
+	return get_mongo_db()["upload_chunks"]
+
+
+def mongo_key(key):
+	# Слова, символы и биграммы становятся именами полей: экранируем то, что Mongo не допускает в путях
+	return key.replace("%", "%25").replace(".", "%2E").replace("$", "%24").replace("\x00", "%00")
+
+
+def from_mongo_key(key):
+	return unquote(key)
+
+
+def _expires_at():
+	return datetime.utcnow() + timedelta(seconds=settings.CHUNKED_UPLOAD_SESSION_TTL)
+
+
+def _document_too_large(error):
+	# Слишком большое тело отклоняет либо сам драйвер, либо сервер при upsert
+	if isinstance(error, DocumentTooLarge):
+		return True
+	return isinstance(error, BulkWriteError) and any(
+		write_error["code"] in DOCUMENT_TOO_LARGE_CODES for write_error in error.details.get("writeErrors", [])
+	)
+
+
+def session_state(session):
+	return {
+		"upload_id": session["_id"],
+		"file_name": session["file_name"],
+		"offset": session["received_bytes"],
+		"status": session["status"],
+		"expires_at": session["expires_at"].isoformat(),
+	}
+
+
+def create_upload_session(user, file_name):
+	session = {
+		"_id": uuid.uuid4().hex,
+		"user_id": user.id,
+		"file_name": file_name,
+		"status": "open",
+		"received_bytes": 0,
+		"estimated_body_size": 0,
+		"chunk_ids": [],
+		"pending_bytes": Binary(b""),
+		"carry": "",
+		"previous_token": None,
+		"stats": {},
+		"expires_at": _expires_at(),
+	}
+	get_upload_sessions_collection().insert_one(session)
+	return session
+
+
+def get_upload_session(user, upload_id):
+	session = get_upload_sessions_collection().find_one({"_id": upload_id, "user_id": user.id}, {"stats": 0})
+	if not session:
+		raise UploadError("Upload session not found.", status=404)
+	return session
+
+
+def append_chunk(user, upload_id, offset, data):
+	session = get_upload_session(user, upload_id)
+	if session["status"] != "open":
+		raise UploadError("Upload session is already finalized.", status=409, session=session)
+	if offset != session["received_bytes"]:
+		# Клиент продолжает с offset из ответа, уже принятые байты повторно не отправляются
+		raise UploadError("Chunk offset does not match received bytes.", status=409, session=session)
+	if not data:
+		raise UploadError("Chunk is empty.", session=session)
+	if len(data) > settings.CHUNKED_UPLOAD_CHUNK_SIZE:
+		raise UploadError("Chunk exceeds the maximum chunk size.", status=413, session=session)
+	if offset + len(data) > settings.CHUNKED_UPLOAD_MAX_SIZE:
+		raise UploadError("File exceeds the maximum upload size.", status=413, session=session)
+
+	# Декодируем и анализируем чанк сразу; незавершённые UTF-8 байты и слово на границе чанка переносим в следующий
+	decoder = codecs.getincrementaldecoder("utf-8")()
+	decoder.setstate((bytes(session["pending_bytes"]), 0))
+	try:
+		text = decoder.decode(data)
+	except UnicodeDecodeError:
+		raise UploadError(f"File '{session['file_name']}' is not UTF-8 encoded.", session=session)
+	pending_bytes = decoder.getstate()[0]
+
+	analyzer = Analyzer(carry=session["carry"], previous_token=session.get("previous_token"))
+	analyzer.feed(text)
+
+	# Оценка сверху: ключи, уже встречавшиеся в прошлых чанках, учитываются повторно. Отказываем на этом чанке,
+	# а не на finalize, когда файл уже загружен целиком
+	estimated_size = sum(
+		len(key.encode("utf-8")) + TERM_ENTRY_OVERHEAD
+		for counts in analyzer.partial_counts().values() for key in counts
+	)
+	if session.get("estimated_body_size", 0) + estimated_size > STATISTICS_SIZE_LIMIT:
+		raise UploadError("File statistics exceed the maximum document size.", status=413, session=session)
+
+	# Чанк пишется под собственным id и попадает в сессию только вместе с условным обновлением ниже:
+	# проигравший гонку PUT не может подменить уже учтённые в статистике байты
+	chunk_id = uuid.uuid4().hex
+	chunks = get_upload_chunks_collection()
+	chunks.insert_one({
+		"_id": chunk_id, "upload_id": upload_id, "offset": offset, "data": Binary(data), "expires_at": session["expires_at"]
+	})
+
+	increments = {
+		f"stats.{name}.{mongo_key(key)}": count
+		for name, counts in analyzer.partial_counts().items()
+		for key, count in counts.items() if count
+	}
+	update = {
+		"$set": {
+			"pending_bytes": Binary(pending_bytes),
+			"carry": analyzer.carry,
+			"previous_token": analyzer.previous_token,
+			"expires_at": _expires_at(),
+		},
+		"$inc": {"received_bytes": len(data), "estimated_body_size": estimated_size, **increments},
+		"$push": {"chunk_ids": chunk_id},
+	}
+	session = get_upload_sessions_collection().find_one_and_update(
+		{"_id": upload_id, "status": "open", "received_bytes": offset},
+		update,
+		projection={"stats": 0},
+		return_document=ReturnDocument.AFTER
+	)
+	if not session:
+		chunks.delete_one({"_id": chunk_id})
+		raise UploadError("Chunk was superseded by a concurrent upload.", status=409,
+						  session=get_upload_session(user, upload_id))
+	return session
+
+
+def finalize_upload(user, upload_id):
+	start_time = time.time()
+	sessions = get_upload_sessions_collection()
+	session = sessions.find_one_and_update(
+		{"_id": upload_id, "user_id": user.id, "status": "open"},
+		{"$set": {"status": "finalizing"}},
+		return_document=ReturnDocument.AFTER
+	)
+	if not session:
+		get_upload_session(user, upload_id)
+		raise UploadError("Upload session is already finalized.", status=409)
+
+	try:
+		if session["pending_bytes"]:
+			raise UploadError(f"File '{session['file_name']}' is not UTF-8 encoded.")
+
+		chunks = get_upload_chunks_collection().find({"_id": {"$in": session.get("chunk_ids", [])}}).sort("offset", 1)
+		data = b"".join(bytes(chunk["data"]) for chunk in chunks)
+		if len(data) != session["received_bytes"]:
+			raise UploadError("Uploaded chunks are missing, the upload has to be restarted.", status=409)
+		raw = data.decode("utf-8")
+		del data
+		content = raw.strip()
+		if not content:
+			raise UploadError("Uploaded file is empty.")
+
+		# Статистика уже накоплена по чанкам: остаётся слово из хвоста и поправка на отброшенные strip() пробелы
+		analyzer = Analyzer(carry=session["carry"], previous_token=session.get("previous_token"))
+		analyzer.load_counts({
+			name: {from_mongo_key(key): count for key, count in counts.items()}
+			for name, counts in session.get("stats", {}).items()
+		})
+		analyzer.discard(raw[:len(raw) - len(raw.lstrip())])
+		analyzer.discard(raw[len(raw.rstrip()):])
+		statistics = analyzer.finish()
+
+		[mongo_id] = store_document_bodies([{
+			"content_hash": content_hash(content),
+			"file_name": session["file_name"],
+			"file_size": session["received_bytes"],
+			"content": content,
+			"uploaded_at": datetime.utcnow().isoformat(),
+			**statistics
+		}])
+	except Exception as e:
+		sessions.update_one({"_id": upload_id}, {"$set": {"status": "open"}})
+		if _document_too_large(e):
+			raise UploadError("File statistics exceed the maximum document size.", status=413)
+		raise
+
+	document = Document.objects.create(
+		user=user,
+		name=session["file_name"],
+		size=session["received_bytes"],
+		word_count=statistics["word_count"],
+		mongo_id=str(mongo_id)
+	)
+	add_library_documents(user.id, [mongo_id], [term_counts_from_mongo(statistics)])
+
+	get_upload_chunks_collection().delete_many({"upload_id": upload_id})
+	sessions.delete_one({"_id": upload_id})
+
+	processing_time = round(time.time() - start_time, 3)
+	update_global_metrics(processing_time, 1)
+	record_latency("upload_processing", processing_time * 1000)
+	return document
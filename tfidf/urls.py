@@ -1,18 +1,35 @@
+from django.conf import settings
 from django.urls import path
+
+from .async_views import document_content_view, document_huffman_view
 from .views import (TFIDFMongoUploadView, MetricsView, VersionView, UserDocumentListView, DocumentContentView,
 					DocumentStatisticsView, DocumentDeleteView, CollectionListView, CollectionDetailView,
 					CollectionStatisticsView, AddDocumentToCollectionView, RemoveDocumentFromCollectionView,
-					CollectionCreateView, DeleteCollectionView, DocumentHuffmanView
+					CollectionCreateView, DeleteCollectionView, DocumentHuffmanView, CollectionExportView,
+					CollectionDocumentsView, CollectionStatisticsJobView, ChunkedUploadCreateView, ChunkedUploadView,
+					ChunkedUploadFinalizeView, HuffmanDecodeView
 					)
 
+# Под ASGI-сервером read-эндпойнты документов обслуживаются асинхронными view с async-драйвером Mongo
+if settings.ASYNC_READ_VIEWS:
+	document_content = document_content_view
+	document_huffman = document_huffman_view
+else:
+	document_content = DocumentContentView.as_view()
+	document_huffman = DocumentHuffmanView.as_view()
+
 urlpatterns = [
 	path('upload/', TFIDFMongoUploadView.as_view(), name='tfidf-upload'),
+	path('uploads/', ChunkedUploadCreateView.as_view()),
+	path('uploads/<str:upload_id>/', ChunkedUploadView.as_view()),
+	path('uploads/<str:upload_id>/finalize/', ChunkedUploadFinalizeView.as_view()),
 	path("metrics/", MetricsView.as_view(), name="metrics"),
 	path('version/', VersionView.as_view(), name='version'),
 
 	path('documents/', UserDocumentListView.as_view()),
-	path('documents/<int:document_id>/', DocumentContentView.as_view()),
-	path('documents/<int:document_id>/huffman/', DocumentHuffmanView.as_view()),
+	path('documents/<int:document_id>/', document_content),
+	path('documents/<int:document_id>/huffman/', document_huffman),
+	path('huffman/decode/', HuffmanDecodeView.as_view()),
 	path('documents/<int:document_id>/statistics/', DocumentStatisticsView.as_view()),
 	path('documents/<int:document_id>/delete/', DocumentDeleteView.as_view()),
 
@@ -20,6 +37,10 @@ urlpatterns = [
 	path('collections/', CollectionListView.as_view()),
 	path('collections/<int:collection_id>/', CollectionDetailView.as_view()),
 	path('collections/<int:collection_id>/statistics/', CollectionStatisticsView.as_view()),
+	path('collections/<int:collection_id>/statistics/job/', CollectionStatisticsJobView.as_view(),
+		 name='collection-statistics-job'),
+	path('collections/<int:collection_id>/export/', CollectionExportView.as_view()),
+	path('collections/<int:collection_id>/documents/', CollectionDocumentsView.as_view()),
 	path('collections/<int:collection_id>/<int:document_id>/', AddDocumentToCollectionView.as_view()),
 	path('collections/<int:collection_id>/<int:document_id>/delete/', RemoveDocumentFromCollectionView.as_view()),
 	path('collections/<int:collection_id>/delete/', DeleteCollectionView.as_view())
@@ -1,24 +1,46 @@
 import heapq
 import math
+import multiprocessing
 import re
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .timing import phase
 
 token_pattern = re.compile(r'\b\w+\b')
+# Те же токены, что у tokenize, но с сохранением регистра и разделителей между ними
+word_symbol_pattern = re.compile(f"({token_pattern.pattern})")
+
+_tokenize_executor = None
 
 
 def tokenize(text):
 	return token_pattern.findall(text.lower())
 
 
+def get_tokenize_executor():
+	global _tokenize_executor
+	if _tokenize_executor is None:
+		# spawn: воркеры не наследуют потоки и соединения с БД процесса веб-сервера
+		_tokenize_executor = ProcessPoolExecutor(
+			max_workers=settings.TOKENIZE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+		)
+	return _tokenize_executor
+
+
 def compute_global_tfidf_table(documents):
-	N = len(documents)
+	with phase("tokenize"):
+		term_counts = [Counter(tokenize(doc)) for doc in documents]
+	return compute_tfidf_from_counts(term_counts)
+
+
+def compute_tfidf_from_counts(term_counts):
+	N = len(term_counts)
 	df = defaultdict(int)
-	tokenized_docs = []
-	for doc in documents:
-		tokens = tokenize(doc)
-		tokenized_docs.append(tokens)
-		unique_tokens = set(tokens)
-		for word in unique_tokens:
+	for tf_counter in term_counts:
+		for word in tf_counter:
 			df[word] += 1
 	global_idf = {word: math.log(N / count) for word, count in df.items()}
 
@@ -30,11 +52,10 @@ def compute_global_tfidf_table(documents):
 	word_counts = []
 
 	# Расчет TF для топ-50 слов по каждому документу
-	for tokens in tokenized_docs:
-		total_words = len(tokens)
+	for tf_counter in term_counts:
+		total_words = sum(tf_counter.values())
 		word_counts.append(total_words)
 
-		tf_counter = Counter(tokens)
 		doc_result = [
 			{
 				"word": word,
@@ -48,6 +69,12 @@ def compute_global_tfidf_table(documents):
 	return results, word_counts
 
 
+def word_rank_key(item):
+	# Порядок рейтинга слов документа: по убыванию частоты, при равенстве по алфавиту
+	word, count = item
+	return -count, word
+
+
 class HuffmanNode:
 	def __init__(self, char, freq):
 		self.char = char
@@ -60,7 +87,10 @@ class HuffmanNode:
 
 
 def build_huffman_tree(text):
-	freq_counter = Counter(text)		# TODO O(N)
+	return build_huffman_tree_from_counts(Counter(text))		# TODO O(N)
+
+
+def build_huffman_tree_from_counts(freq_counter):
 	heap = [HuffmanNode(char, freq) for char, freq in freq_counter.items()]
 	heapq.heapify(heap) 				# TODO O(U)
 
@@ -88,5 +118,173 @@ def generate_codes(node, prefix="", code_map=None):
 	return code_map
 
 
+def code_lengths(node, depth=0, lengths=None):
+	if lengths is None:
+		lengths = {}
+
+	if node is not None:
+		if node.char is not None:
+			# Единственный символ в тексте всё равно должен занимать хотя бы один бит
+			lengths[node.char] = max(depth, 1)
+		code_lengths(node.left, depth + 1, lengths)
+		code_lengths(node.right, depth + 1, lengths)
+
+	return lengths
+
+
+def canonical_codes(lengths):
+	# Канонические коды однозначно восстанавливаются по длинам: символы упорядочены по (длина, символ)
+	code_map = {}
+	code = 0
+	previous_length = 0
+	for char, length in sorted(lengths.items(), key=lambda item: (item[1], item[0])):
+		code <<= length - previous_length
+		code_map[char] = format(code, f"0{length}b")
+		code += 1
+		previous_length = length
+	return code_map
+
+
+def build_huffman_codes(freq_counter):
+	return canonical_codes(code_lengths(build_huffman_tree_from_counts(freq_counter)))
+
+
+def huffman_symbols(text, mode="char"):
+	# В режиме word символами Хаффмана становятся токены и разделители, поэтому текст восстанавливается без потерь
+	if mode == "word":
+		return [symbol for symbol in word_symbol_pattern.split(text) if symbol]
+	return text
+
+
+def huffman_table_bits(code_map):
+	# Размер канонической таблицы: сам символ в UTF-8 и байт с длиной кода
+	return sum(8 * len(symbol.encode("utf-8")) + 8 for symbol in code_map)
+
+
 def huffman_encode(text, code_map):
 	return ''.join(code_map[char] for char in text)
+
+
+def encoded_size(text, code_map):
+	return sum(len(code_map[char]) * count for char, count in Counter(text).items())
+
+
+def iter_huffman_encode(text, code_map, chunk_size=8192):
+	for start in range(0, len(text), chunk_size):
+		yield huffman_encode(text[start:start + chunk_size], code_map)
+
+
+def pack_bits(bits):
+	# Строка из '0'/'1' -> (байты, число значащих бит); последний байт дополняется нулями
+	bit_length = len(bits)
+	if not bit_length:
+		return b"", 0
+	padding = -bit_length % 8
+	return int(bits + "0" * padding, 2).to_bytes((bit_length + padding) // 8, "big"), bit_length
+
+
+def unpack_bits(data, bit_length):
+	if not bit_length:
+		return ""
+	return format(int.from_bytes(data, "big"), f"0{len(data) * 8}b")[:bit_length]
+
+
+class HuffmanDecoder:
+	# Таблица на lookup_bits бит: каждому значению соответствуют все символы, целиком помещающиеся в эти биты,
+	# поэтому за одно обращение декодируется сразу несколько символов. Более длинные коды разбираются побитно.
+	def __init__(self, code_map, lookup_bits=12):
+		if not code_map:
+			raise ValueError("Code table is empty.")
+
+		codes = {}
+		for char, code in code_map.items():
+			if not code or code.strip("01"):
+				raise ValueError(f"Invalid code for symbol {char!r}.")
+			key = (len(code), int(code, 2))
+			if key in codes:
+				raise ValueError(f"Duplicate code {code}.")
+			codes[key] = char
+
+		ordered = sorted(code_map.values())
+		for shorter, longer in zip(ordered, ordered[1:]):
+			if longer.startswith(shorter):
+				raise ValueError(f"Code table is not prefix-free: {shorter} is a prefix of {longer}.")
+
+		self.codes = codes
+		self.max_length = max(length for length, _ in codes)
+		self.lookup_bits = min(lookup_bits, self.max_length)
+		self.table = self._build_table()
+
+	def _build_table(self):
+		bits = self.lookup_bits
+		size = 1 << bits
+		single = [None] * size
+		for (length, code), char in self.codes.items():
+			if length <= bits:
+				start = code << (bits - length)
+				for index in range(start, start + (1 << (bits - length))):
+					single[index] = (char, length)
+
+		mask = size - 1
+		table = []
+		for index in range(size):
+			chars = []
+			used = 0
+			while used < bits:
+				entry = single[(index << used) & mask]
+				if entry is None or entry[1] > bits - used:
+					break
+				chars.append(entry[0])
+				used += entry[1]
+			table.append(("".join(chars), used))
+		return table
+
+	def _decode_slow(self, buffer, available, limit):
+		# Побитный разбор одного символа: для кодов длиннее таблицы и для хвоста потока
+		codes = self.codes
+		code = 0
+		for length in range(1, min(available, limit, self.max_length) + 1):
+			code = (code << 1) | ((buffer >> (available - length)) & 1)
+			char = codes.get((length, code))
+			if char is not None:
+				return char, length
+		raise ValueError("Bitstream does not match the code table.")
+
+	def decode(self, data, bit_length):
+		if bit_length > len(data) * 8:
+			raise ValueError("bit_length exceeds the bitstream size.")
+
+		bits = self.lookup_bits
+		mask = (1 << bits) - 1
+		table = self.table
+		out = []
+		buffer = 0
+		available = 0
+		position = 0
+		consumed = 0
+
+		need = self.max_length
+		while consumed < bit_length:
+			while available < need and position < len(data):
+				chunk = data[position:position + 8]
+				buffer = (buffer << (8 * len(chunk))) | int.from_bytes(chunk, "big")
+				available += 8 * len(chunk)
+				position += len(chunk)
+
+			remaining = bit_length - consumed
+			if remaining >= bits and available >= bits:
+				chars, used = table[(buffer >> (available - bits)) & mask]
+				if used:
+					out.append(chars)
+				else:
+					chars, used = self._decode_slow(buffer, available, remaining)
+					out.append(chars)
+			else:
+				chars, used = self._decode_slow(buffer, available, remaining)
+				out.append(chars)
+
+			available -= used
+			consumed += used
+			buffer &= (1 << available) - 1
+
+		return "".join(out)
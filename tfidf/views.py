@@ -1,21 +1,45 @@
+import math
+import time
+from contextlib import contextmanager
+
 from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.parsers import MultiPartParser
 from rest_framework import status, permissions
-from bson import ObjectId
-from django.http import Http404, JsonResponse
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 
+from .etags import conditional_get, document_etag, document_statistics_etag, document_list_etag, collection_etag, \
+	collection_statistics_etag
+from .distributed import get_job_progress, resume_distributed_statistics
+from .export import iter_document_term_matrix, CONTENT_TYPE as EXPORT_CONTENT_TYPE
+from .histograms import get_latency_percentiles
 from .models import Document, Collection
-from .mongo import get_documents_collection, get_metrics_collection, update_collection_statistics_in_mongo
+from .pagination import IdCursorPagination
+from .replicas import ReplicaReadMixin
+from .admission import AdmissionControlMixin, heavy_slot, document_cost, collection_cost
+from .payloads import collection_detail_payload
+from .parsers import OctetStreamParser
+from .mongo import get_document_body, get_metrics_collection, release_document_body, get_huffman_codes, \
+	get_collection_statistics_collection, delete_collection_statistics, get_collection_word_stats_page, \
+	get_document_word_stats_page, library_document_frequencies, remove_library_document, compute_collection_top_words, \
+	get_collection_statistics_payload, document_content, HUFFMAN_MODES, CONTENT_FIELDS
 from .serializers import CollectionSerializer, DocumentSerializer, CollectionCreateSerializer, TFIDFUploadSerializer, \
-	DocumentStatisticsSerializer, CollectionStatisticsSerializer
-from .utils import build_huffman_tree, generate_codes, huffman_encode, compute_global_tfidf_table
+	CollectionStatisticsSerializer, CollectionMembershipSerializer, ChunkedUploadInitSerializer, HuffmanDecodeSerializer, \
+	WordStatsPageSerializer
+from .tasks import schedule_collection_recompute
+from .streaming import get_stream_format, streaming_response, iter_json_string, JSON_CONTENT_TYPE
+from .timing import phase
+from .uploads import UploadError, session_state, create_upload_session, get_upload_session, append_chunk, \
+	finalize_upload
+from .utils import huffman_encode, encoded_size, iter_huffman_encode
 
 
-class TFIDFMongoUploadView(APIView):
+class TFIDFMongoUploadView(AdmissionControlMixin, APIView):
 	parser_classes = [MultiPartParser]
 	permission_classes = [permissions.IsAuthenticated]
 
@@ -30,6 +54,73 @@ class TFIDFMongoUploadView(APIView):
 		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def upload_error_response(error):
+	data = {"error": str(error)}
+	if error.session:
+		data.update(session_state(error.session))
+	return Response(data, status=error.status)
+
+
+class ChunkedUploadCreateView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+
+	def post(self, request):
+		serializer = ChunkedUploadInitSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		session = create_upload_session(request.user, serializer.validated_data['file_name'])
+		return Response(session_state(session), status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadView(AdmissionControlMixin, APIView):
+	# PUT принимает очередной чанк с заголовком Upload-Offset; GET возвращает offset для продолжения после обрыва
+	parser_classes = [OctetStreamParser]
+	permission_classes = [permissions.IsAuthenticated]
+
+	def get(self, request, upload_id):
+		try:
+			session = get_upload_session(request.user, upload_id)
+		except UploadError as e:
+			return upload_error_response(e)
+		return Response(session_state(session))
+
+	def put(self, request, upload_id):
+		try:
+			offset = int(request.headers.get('Upload-Offset', ''))
+		except ValueError:
+			return Response({"error": "Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+		try:
+			with phase("chunk"):
+				session = append_chunk(request.user, upload_id, offset, request.data)
+		except UploadError as e:
+			return upload_error_response(e)
+		return Response(session_state(session))
+
+
+class ChunkedUploadFinalizeView(AdmissionControlMixin, APIView):
+	permission_classes = [permissions.IsAuthenticated]
+
+	def request_cost(self, request, upload_id):
+		try:
+			return get_upload_session(request.user, upload_id)["received_bytes"]
+		except UploadError:
+			return 0
+
+	def post(self, request, upload_id):
+		try:
+			document = finalize_upload(request.user, upload_id)
+		except UploadError as e:
+			return upload_error_response(e)
+		return Response({
+			"message": "File processed and stored successfully in MongoDB",
+			"file_id": document.mongo_id,
+			"document_id": document.id,
+			"file_name": document.name,
+			"file_size": document.size,
+			"word_count": document.word_count
+		}, status=status.HTTP_200_OK)
+
+
 class MetricsView(APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
@@ -52,7 +143,8 @@ class MetricsView(APIView):
 					"min_time_processed": round(metrics.get("min_time_processed", 0.0), 3),
 					"avg_time_processed": avg_time,
 					"max_time_processed": round(metrics.get("max_time_processed", 0.0), 3),
-					"latest_file_processed_timestamp": round(metrics.get("latest_file_processed_timestamp", 0.0), 3)
+					"latest_file_processed_timestamp": round(metrics.get("latest_file_processed_timestamp", 0.0), 3),
+					"latency": get_latency_percentiles()
 				}
 			else:
 				user_files = Document.objects.filter(user=request.user)
@@ -85,25 +177,55 @@ class VersionView(APIView):
 		return Response({'version': '3.0'}, status=status.HTTP_200_OK)
 
 
-class DocumentHuffmanView(APIView):
+class DocumentHuffmanView(AdmissionControlMixin, ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
+	admission_etag_func = staticmethod(document_etag)
 
+	def request_cost(self, request, document_id):
+		return document_cost(request, document_id)
+
+	@conditional_get(document_etag)
 	def get(self, request, document_id):
 		doc = Document.objects.filter(id=document_id, user=request.user).first()
 		if not doc:
 			raise Http404("Document not found")
 
-		mongo_doc = get_documents_collection().find_one({"_id": ObjectId(doc.mongo_id)})
+		with phase("fetch"):
+			mongo_doc = get_document_body(doc.mongo_id)
 		if not mongo_doc:
 			raise Http404("Document content not found in MongoDB")
 
-		content = mongo_doc.get("content", "")
+		content = document_content(mongo_doc)
 		if not content:
 			return JsonResponse({"error": "Document content is empty"}, status=400)
 
-		tree = build_huffman_tree(content)
-		code_map = generate_codes(tree)
-		encoded_text = huffman_encode(content, code_map)
+		mode = request.GET.get('mode', 'char')
+		if mode not in HUFFMAN_MODES:
+			return JsonResponse({"error": f"mode must be one of: {', '.join(HUFFMAN_MODES)}"}, status=400)
+
+		with phase("huffman"):
+			mode, code_map, symbols = get_huffman_codes(mongo_doc, mode, content)
+		original_bits = len(content.encode("utf-8")) * 8
+
+		stream_format = get_stream_format(request)
+		if stream_format:
+			total_size = encoded_size(symbols, code_map)
+			header = {
+				"mode": mode,
+				"huffman_codes": code_map,
+				"total_size": total_size,
+				"compression_ratio": round(total_size / original_bits, 4),
+			}
+			chunks = iter_huffman_encode(symbols, code_map)
+			if stream_format == "ndjson":
+				return streaming_response(stream_format, header, "encoded_text", chunks)
+			return StreamingHttpResponse(
+				iter_json_string(header, "encoded_text", chunks), content_type=JSON_CONTENT_TYPE
+			)
+
+		started = time.perf_counter()
+		encoded_text = huffman_encode(symbols, code_map)
+		encode_time_ms = round((time.perf_counter() - started) * 1000, 3)
 
 		# пагинация
 		offset = int(request.GET.get('offset', 0))
@@ -114,39 +236,66 @@ class DocumentHuffmanView(APIView):
 		is_end = end >= total_size
 
 		return JsonResponse({
+			"mode": mode,
 			"huffman_codes": code_map,
 			"encoded_text": paginated_text,
 			"total_size": total_size,
+			"compression_ratio": round(total_size / original_bits, 4),
+			"encode_time_ms": encode_time_ms,
 			"offset": offset,
 			"limit": limit,
 			"is_end": is_end
 		}, json_dumps_params={'ensure_ascii': False})
 
 
-class UserDocumentListView(APIView):
+class HuffmanDecodeView(AdmissionControlMixin, APIView):
+	# Декодирует упакованный битовый поток (base64) по таблице кодов; с document_id сверяет результат с документом
+	permission_classes = [permissions.IsAuthenticated]
+
+	def post(self, request):
+		serializer = HuffmanDecodeSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		data = serializer.validated_data
+
+		try:
+			with phase("huffman_decode"):
+				text = data['decoder'].decode(data['data'], data['bit_length'])
+		except ValueError as e:
+			return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+		result = {"text": text, "length": len(text)}
+		if 'document_id' in data:
+			doc = get_object_or_404(Document, id=data['document_id'], user=request.user)
+			mongo_doc = get_document_body(doc.mongo_id, CONTENT_FIELDS)
+			if not mongo_doc:
+				raise Http404("Document content not found in MongoDB")
+			result["matches"] = document_content(mongo_doc) == text
+		return Response(result)
+
+
+class UserDocumentListView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
+	@conditional_get(document_list_etag)
 	def get(self, request):
-		paginator = PageNumberPagination()
-		paginator.page_size = 20
-		queryset = Document.objects.filter(user=request.user).order_by('-id')
+		paginator = IdCursorPagination()
+		queryset = Document.objects.filter(user=request.user).order_by('-id').prefetch_related('collections')
 		result_page = paginator.paginate_queryset(queryset, request)
 		serializer = DocumentSerializer(result_page, many=True)
 		return paginator.get_paginated_response(serializer.data)
 
 
-class DocumentContentView(APIView):
+class DocumentContentView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
+	@conditional_get(document_etag)
 	def get(self, request, document_id):
 		doc = get_object_or_404(Document, id=document_id, user=request.user)
-		mongo_doc = get_documents_collection().find_one(
-			{"_id": ObjectId(doc.mongo_id)}, {"content": 1}
-		)
+		mongo_doc = get_document_body(doc.mongo_id, CONTENT_FIELDS)
 		if not mongo_doc:
 			raise Http404("Document not found in MongoDB")
 
-		content = mongo_doc.get("content", "")
+		content = document_content(mongo_doc)
 		offset = int(request.query_params.get("offset", 0))
 		limit = int(request.query_params.get("limit", 10000))
 
@@ -161,64 +310,107 @@ class DocumentContentView(APIView):
 		})
 
 
-class DocumentStatisticsView(APIView):
+@contextmanager
+def inline_statistics_slot(collection):
+	# Коллекцию от DISTRIBUTED_STATS_MIN_DOCUMENTS в запросе не считаем никогда (таймаут gunicorn),
+	# от ADMISSION_HEAVY_COLLECTION_DOCUMENTS — только со свободным тяжёлым слотом
+	documents_count = collection.documents.count()
+	if documents_count >= settings.DISTRIBUTED_STATS_MIN_DOCUMENTS:
+		yield False
+	elif documents_count >= settings.ADMISSION_HEAVY_COLLECTION_DOCUMENTS:
+		with heavy_slot() as admitted:
+			yield admitted
+	else:
+		yield True
+
+
+def statistics_pending_response(request, collection):
+	schedule_collection_recompute(collection.id)
+	return Response(
+		{
+			"detail": "Statistics are being computed.",
+			"job": get_job_progress(collection.id),
+			"job_url": request.build_absolute_uri(reverse('collection-statistics-job', args=[collection.id])),
+		},
+		status=status.HTTP_202_ACCEPTED,
+		headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)}
+	)
+
+
+class DocumentStatisticsView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
+	@conditional_get(document_statistics_etag)
 	def get(self, request, document_id):
 		doc = get_object_or_404(Document, id=document_id, user=request.user)
 		collection_id = request.query_params.get('collection_id')
-		page = int(request.query_params.get('page', 1))
-		page_size = int(request.query_params.get('page_size', 50))
+		params = WordStatsPageSerializer(data=request.query_params)
+		params.is_valid(raise_exception=True)
+		page, page_size = params.validated_data['page'], params.validated_data['page_size']
+		start = (page - 1) * page_size
+		stale = False
 		if collection_id:
 			collection = get_object_or_404(Collection, id=collection_id, user=request.user)
-			mongo_ids = [d.mongo_id for d in collection.documents.all()]
-			documents = list(get_documents_collection().find({
-				"_id": {"$in": [ObjectId(mongo_id) for mongo_id in mongo_ids]}
-			}))
-
-			if not documents:
-				raise Http404("No documents found in MongoDB for this collection")
-
-			texts = [doc.get("content", "") for doc in documents]
-			tfidf_results, _ = compute_global_tfidf_table(texts)
-
-			tf_aggregated = {}
-			for d in tfidf_results:
-				for entry in d:
-					word = entry["word"]
-					tf_aggregated[word] = tf_aggregated.get(word, 0) + entry["tf"]
-
-			idf_lookup = {entry["word"]: entry["idf"] for entry in tfidf_results[0]}
-
-			tfidf_combined = [
-				{"word": word, "total_tf": round(tf, 6), "idf": round(idf_lookup[word], 6)}
-				for word, tf in tf_aggregated.items()
-			]
-
-			tfidf_data = sorted(tfidf_combined, key=lambda x: x["idf"], reverse=True)
+			# Страница читается из сохранённого рейтинга через $slice, без загрузки остальных слов
+			stored = get_collection_word_stats_page(collection.id, start, page_size)
+			if stored is not None:
+				paginated_data, total_words, stale = stored
+			else:
+				with inline_statistics_slot(collection) as admitted:
+					if not admitted:
+						return statistics_pending_response(request, collection)
+					mongo_ids = list(collection.documents.values_list('mongo_id', flat=True))
+					documents_count, top_words = compute_collection_top_words(mongo_ids)
+				if not documents_count:
+					raise Http404("No documents found in MongoDB for this collection")
+				schedule_collection_recompute(collection.id)
+				paginated_data, total_words = top_words[start:start + page_size], len(top_words)
 
 		else:
 			# Статистика только по документу
-			mongo_doc = get_documents_collection().find_one({"_id": ObjectId(doc.mongo_id)})
-			if not mongo_doc:
+			stored = get_document_word_stats_page(doc.mongo_id, start, page_size)
+			if stored is None:
 				raise Http404("Statistics not found for the document")
-
-			tfidf_data = mongo_doc.get("tfidf_data", [])
-		start = (page - 1) * page_size
-		end = start + page_size
-		paginated_data = tfidf_data[start:end]
-
-		serializer = DocumentStatisticsSerializer(
-			{"tfidf_data": paginated_data},
-			context={"document": doc}
-		)
+			paginated_data, total_words = stored
+
+			# IDF слов страницы считается по всей библиотеке пользователя: DF ведётся при записи,
+			# здесь читаются только слова страницы
+			words = [entry["word"] for entry in paginated_data]
+			with phase("tfidf"):
+				documents, df = library_document_frequencies(request.user.id, words)
+			for entry in paginated_data:
+				entry["idf"] = round(math.log(documents / df[entry["word"]]), 6) if df.get(entry["word"]) else 0.0
+
+		stream_format = get_stream_format(request)
+		if stream_format:
+			header = {
+				"document_id": doc.id,
+				"collection_id": collection_id,
+				"page": page,
+				"page_size": page_size,
+				"total_words": total_words,
+				"stale": stale,
+			}
+			items = (
+				{"word": entry["word"], "tf": entry["total_tf"], "idf": entry["idf"]}
+				for entry in paginated_data
+			)
+			return streaming_response(stream_format, header, "tfidf_data", items)
+
+		# Записи уже в нужной форме, поэтому сериализатор не нужен
+		with phase("serialize"):
+			tfidf_data = [
+				{"word": entry["word"], "tf": entry["total_tf"], "idf": entry["idf"]}
+				for entry in paginated_data
+			]
 		return Response({
 			"document_id": doc.id,
 			"collection_id": collection_id,
 			"page": page,
 			"page_size": page_size,
-			"total_words": len(tfidf_data),
-			"tfidf_data": serializer.data['tfidf_data']
+			"total_words": total_words,
+			"stale": stale,
+			"tfidf_data": tfidf_data
 		})
 
 
@@ -227,8 +419,13 @@ class DocumentDeleteView(APIView):
 
 	def delete(self, request, document_id):
 		doc = get_object_or_404(Document, id=document_id, user=request.user)
-		get_documents_collection().delete_one({"_id": ObjectId(doc.mongo_id)})
+		collection_ids = list(doc.collections.values_list('id', flat=True))
+		remove_library_document(request.user.id, doc.mongo_id)
+		release_document_body(doc.mongo_id)
+		doc.collections.all().touch()
 		doc.delete()
+		for collection_id in collection_ids:
+			schedule_collection_recompute(collection_id)
 		return Response({"message": "Document deleted"})
 
 
@@ -245,39 +442,98 @@ class CollectionCreateView(APIView):
 		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CollectionListView(APIView):
+class CollectionListView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
 	def get(self, request):
-		paginator = PageNumberPagination()
-		paginator.page_size = 20
-		collections = Collection.objects.filter(user=request.user).order_by('-id')
+		paginator = IdCursorPagination()
+		collections = Collection.objects.filter(user=request.user).order_by('-id') \
+			.prefetch_related('documents__collections')
 		result_page = paginator.paginate_queryset(collections, request)
 		serializer = CollectionSerializer(result_page, many=True)
 		return paginator.get_paginated_response(serializer.data)
 
 
-class CollectionDetailView(APIView):
+class CollectionDetailView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
+	@conditional_get(collection_etag)
 	def get(self, request, collection_id):
 		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
-		serializer = CollectionSerializer(collection)
-		return Response(serializer.data)
+
+		stream_format = get_stream_format(request)
+		if stream_format:
+			documents = collection.documents.order_by('id').prefetch_related('collections').iterator(chunk_size=500)
+			items = (DocumentSerializer(document).data for document in documents)
+			header = {"id": collection.id, "name": collection.name}
+			return streaming_response(stream_format, header, "documents", items)
+
+		with phase("serialize"):
+			payload = collection_detail_payload(collection)
+		return Response(payload)
 
 
-class CollectionStatisticsView(APIView):
+class CollectionStatisticsView(ReplicaReadMixin, APIView):
 	permission_classes = [permissions.IsAuthenticated]
 
+	@conditional_get(collection_statistics_etag)
 	def get(self, request, collection_id):
 		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
-		try:
-			serializer = CollectionStatisticsSerializer.from_collection(collection)
-			return Response(serializer.data)
-		except ValidationError as ve:
-			return Response({"error": str(ve)}, status=404)
-		except Exception as e:
-			return Response({"error": f"Failed to compute statistics: {e}"}, status=500)
+
+		# Отдаём последнюю посчитанную статистику; stale=True значит, что пересчёт ещё в очереди
+		payload = get_collection_statistics_payload(collection.id)
+		if payload is not None:
+			return Response(payload)
+
+		stats = get_collection_statistics_collection().find_one({"collection_id": collection.id}, {"_id": 0})
+		if stats and "top_words" in stats:
+			return Response(CollectionStatisticsSerializer(stats).data)
+
+		# Большую коллекцию считаем в Celery и отдаём 202 со ссылкой на задание
+		with inline_statistics_slot(collection) as admitted:
+			if not admitted:
+				return statistics_pending_response(request, collection)
+
+			try:
+				serializer = CollectionStatisticsSerializer.from_collection(collection)
+				schedule_collection_recompute(collection.id)
+				return Response(serializer.data)
+			except ValidationError as ve:
+				return Response({"error": str(ve)}, status=404)
+			except Exception as e:
+				return Response({"error": f"Failed to compute statistics: {e}"}, status=500)
+
+
+class CollectionStatisticsJobView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+
+	def get(self, request, collection_id):
+		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
+		progress = get_job_progress(collection.id)
+		if progress is None:
+			raise Http404("No statistics job for this collection")
+		return Response(progress)
+
+	def post(self, request, collection_id):
+		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
+		progress = get_job_progress(collection.id)
+		if progress is None:
+			raise Http404("No statistics job for this collection")
+		resume_distributed_statistics(progress["job_id"])
+		return Response(get_job_progress(collection.id), status=status.HTTP_202_ACCEPTED)
+
+
+class CollectionExportView(AdmissionControlMixin, APIView):
+	permission_classes = [permissions.IsAuthenticated]
+
+	def request_cost(self, request, collection_id):
+		return collection_cost(request, collection_id)
+
+	def get(self, request, collection_id):
+		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
+		response = StreamingHttpResponse(iter_document_term_matrix(collection), content_type=EXPORT_CONTENT_TYPE)
+		response["Content-Disposition"] = f'attachment; filename="collection-{collection.id}.tfdtm"'
+		return response
 
 
 class AddDocumentToCollectionView(APIView):
@@ -289,13 +545,41 @@ class AddDocumentToCollectionView(APIView):
 
 		collection.documents.add(document)
 		collection.save()
+		Collection.objects.filter(id=collection.id).touch()
+		Document.objects.filter(id=document.id).touch()
+		schedule_collection_recompute(collection.id)
 
-		try:
-			update_collection_statistics_in_mongo(collection)
-		except Exception as e:
-			return Response({"error": f"Failed to update collection statistics: {e}"}, status=500)
+		return Response({"status": "Document added, collection statistics update scheduled."})
+
+
+class CollectionDocumentsView(APIView):
+	permission_classes = [permissions.IsAuthenticated]
+
+	def post(self, request, collection_id):
+		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
+		serializer = CollectionMembershipSerializer(data=request.data, context={'request': request})
+		if not serializer.is_valid():
+			return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+		add = serializer.validated_data['add']
+		remove = serializer.validated_data['remove']
+		with transaction.atomic():
+			if add:
+				collection.documents.add(*add)
+			if remove:
+				collection.documents.remove(*remove)
+			Collection.objects.filter(id=collection.id).touch()
+			Document.objects.filter(id__in=add + remove).touch()
+
+		# Статистика пересчитывается один раз на весь пакет изменений
+		schedule_collection_recompute(collection.id)
+		documents_count = collection.documents.count()
 
-		return Response({"status": "Document added and collection statistics updated successfully."})
+		return Response({
+			"added": len(add),
+			"removed": len(remove),
+			"documents_count": documents_count,
+		})
 
 
 class RemoveDocumentFromCollectionView(APIView):
@@ -305,6 +589,9 @@ class RemoveDocumentFromCollectionView(APIView):
 		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
 		document = get_object_or_404(Document, id=document_id, user=request.user)
 		collection.documents.remove(document)
+		Collection.objects.filter(id=collection.id).touch()
+		Document.objects.filter(id=document.id).touch()
+		schedule_collection_recompute(collection.id)
 		return Response({"message": "Document removed from collection"})
 
 
@@ -313,5 +600,7 @@ class DeleteCollectionView(APIView):
 
 	def delete(self, request, collection_id):
 		collection = get_object_or_404(Collection, id=collection_id, user=request.user)
+		collection.documents.all().touch()
 		collection.delete()
+		delete_collection_statistics(collection_id)
 		return Response({"message": "Document deleted"})